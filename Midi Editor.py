@@ -1,45 +1,76 @@
 import mido
 import os
+import threading
 import tkinter as tk
 from tkinter import filedialog, ttk
 
-# General MIDI instrument names (0-127)
-GM_INSTRUMENTS = [
-    "Acoustic Grand Piano", "Bright Acoustic Piano", "Electric Grand Piano", "Honky-tonk Piano",
-    "Electric Piano 1", "Electric Piano 2", "Harpsichord", "Clavi", "Celesta", "Glockenspiel",
-    "Music Box", "Vibraphone", "Marimba", "Xylophone", "Tubular Bells", "Dulcimer",
-    "Drawbar Organ", "Percussive Organ", "Rock Organ", "Church Organ", "Reed Organ",
-    "Accordion", "Harmonica", "Tango Accordion", "Acoustic Guitar (nylon)", "Acoustic Guitar (steel)",
-    "Electric Guitar (jazz)", "Electric Guitar (clean)", "Electric Guitar (muted)", "Overdriven Guitar",
-    "Distortion Guitar", "Guitar harmonics", "Acoustic Bass", "Electric Bass (finger)",
-    "Electric Bass (pick)", "Fretless Bass", "Slap Bass 1", "Slap Bass 2", "Synth Bass 1",
-    "Synth Bass 2", "Violin", "Viola", "Cello", "Contrabass", "Tremolo Strings", "Pizzicato Strings",
-    "Orchestral Harp", "Timpani", "String Ensemble 1", "String Ensemble 2", "SynthStrings 1",
-    "SynthStrings 2", "Choir Aahs", "Voice Oohs", "Synth Voice", "Orchestra Hit", "Trumpet",
-    "Trombone", "Tuba", "Muted Trumpet", "French Horn", "Brass Section", "SynthBrass 1",
-    "SynthBrass 2", "Soprano Sax", "Alto Sax", "Tenor Sax", "Baritone Sax", "Oboe",
-    "English Horn", "Bassoon", "Clarinet", "Piccolo", "Flute", "Recorder", "Pan Flute",
-    "Blown Bottle", "Shakuhachi", "Whistle", "Ocarina", "Lead 1 (square)", "Lead 2 (sawtooth)",
-    "Lead 3 (calliope)", "Lead 4 (chiff)", "Lead 5 (charang)", "Lead 6 (voice)", "Lead 7 (fifths)",
-    "Lead 8 (bass + lead)", "Pad 1 (new age)", "Pad 2 (warm)", "Pad 3 (polysynth)", "Pad 4 (choir)",
-    "Pad 5 (bowed)", "Pad 6 (metallic)", "Pad 7 (halo)", "Pad 8 (sweep)", "FX 1 (rain)",
-    "FX 2 (soundtrack)", "FX 3 (crystal)", "FX 4 (atmosphere)", "FX 5 (brightness)",
-    "FX 6 (goblins)", "FX 7 (echoes)", "FX 8 (sci-fi)", "Sitar", "Banjo", "Shamisen",
-    "Koto", "Kalimba", "Bag pipe", "Fiddle", "Shanai", "Tinkle Bell", "Agogo", "Steel Drums",
-    "Woodblock", "Taiko Drum", "Melodic Tom", "Synth Drum", "Reverse Cymbal", "Guitar Fret Noise",
-    "Breath Noise", "Seashore", "Bird Tweet", "Telephone Ring", "Helicopter", "Applause",
-    "Gunshot"
-]
+from midi_cache import MidiCache
+from midi_stream import filter_channels
+from piano_prep import prepare_file
+from piano_roll import PianoRoll
+
+TASK_POLL_MS = 100  # How often the GUI checks on a running task
+
+
+class Cancelled(Exception):
+    """Raised inside a task's work when Cancel was pressed."""
+
+
+class EditorTask(threading.Thread):
+    """Run work(task) off the Tk thread.
+
+    work reports through task.step(stage) and task.progress(fraction), both
+    of which raise Cancelled once cancel() has been called. The GUI reads
+    stage/fraction and, when the thread has finished, result or error; work
+    must not touch Tk itself.
+    """
+
+    def __init__(self, work, on_done):
+        super().__init__(daemon=True)
+        self.work = work
+        self.on_done = on_done  # Called with the result on the Tk thread
+        self.cancel_event = threading.Event()
+        self.stage = ""
+        self.fraction = None
+        self.result = None
+        self.error = None
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def step(self, stage):
+        if self.cancel_event.is_set():
+            raise Cancelled()
+        self.stage = stage
+        self.fraction = None
+
+    def progress(self, fraction):
+        if self.cancel_event.is_set():
+            raise Cancelled()
+        self.fraction = fraction
+
+    def run(self):
+        try:
+            self.result = self.work(self)
+        except Exception as e:
+            self.error = e
+
 
 class MidiChannelEditor:
     def __init__(self, root):
         self.root = root
         self.root.title("MIDI Channel Editor")
-        self.root.geometry("500x450")
+        self.root.geometry("800x650")
         
         self.midi_file = None
         self.file_path = None
+        self.analysis = None  # Per-channel index, built once per load
+        self.deleted_channels = set()  # Applied from the source file on save in streaming mode
+        self.notes = None  # NoteArrays of the loaded file; None when loaded in streaming mode
+        self.cache = MidiCache()  # Parsed files keyed by content hash
         self.channel_vars = []  # List to hold checkbutton variables
+        self.task = None  # Running EditorTask, if any
+        self.action_buttons = []  # Disabled while a task runs
         
         self.setup_gui()
         
@@ -48,7 +79,13 @@ class MidiChannelEditor:
         main_frame = ttk.Frame(self.root, padding="10")
         main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
-        ttk.Button(main_frame, text="Select MIDI File", command=self.load_midi_file).grid(row=0, column=0, pady=5, sticky=tk.W)
+        load_button = ttk.Button(main_frame, text="Select MIDI File", command=self.load_midi_file)
+        load_button.grid(row=0, column=0, pady=5, sticky=tk.W)
+        # Streaming mode never parses the whole file: loading only scans it for channels (no note
+        # columns, so no piano-roll preview) and channels are filtered byte by byte on save
+        self.streaming_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(main_frame, text="Streaming mode (large files)",
+                        variable=self.streaming_var).grid(row=0, column=0, pady=5, sticky=tk.E)
         self.file_label = ttk.Label(main_frame, text="No MIDI file selected")
         self.file_label.grid(row=1, column=0, pady=5, sticky=tk.W)
         
@@ -64,17 +101,66 @@ class MidiChannelEditor:
         self.channel_frame = ttk.Frame(self.canvas)
         self.canvas.create_window((0, 0), window=self.channel_frame, anchor="nw")
         
-        ttk.Button(main_frame, text="Delete Selected Channels", command=self.delete_channel).grid(row=3, column=0, pady=5, sticky=tk.W)
-        ttk.Button(main_frame, text="Save Edited File", command=self.save_midi_file).grid(row=4, column=0, pady=5, sticky=tk.W)
+        delete_button = ttk.Button(main_frame, text="Delete Selected Channels", command=self.delete_channel)
+        delete_button.grid(row=3, column=0, pady=5, sticky=tk.W)
+        # Stops the running load, delete or save
+        self.cancel_button = ttk.Button(main_frame, text="Cancel", command=self.cancel_task, state="disabled")
+        self.cancel_button.grid(row=3, column=0, pady=5, sticky=tk.E)
+        save_button = ttk.Button(main_frame, text="Save Edited File", command=self.save_midi_file)
+        save_button.grid(row=4, column=0, pady=5, sticky=tk.W)
+        self.action_buttons = [load_button, delete_button, save_button]
+        # Fold range, merge duplicates, cap polyphony and drop fast re-strikes on save
+        self.piano_prep_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(main_frame, text="Prepare for piano",
+                        variable=self.piano_prep_var).grid(row=4, column=0, pady=5, sticky=tk.E)
         
         self.status_label = ttk.Label(main_frame, text="")
         self.status_label.grid(row=5, column=0, pady=5, sticky=tk.W)
+
+        # Preview of the loaded notes; checked channels are highlighted, deleted ones disappear
+        self.piano_roll = PianoRoll(main_frame)
+        self.piano_roll.grid(row=6, column=0, columnspan=2, pady=5, sticky=(tk.W, tk.E, tk.N, tk.S))
         
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
         main_frame.columnconfigure(0, weight=1)
         main_frame.rowconfigure(2, weight=1)
+        main_frame.rowconfigure(6, weight=2)
         
+    def start_task(self, work, on_done):
+        """Run work on an EditorTask and call on_done(result) on the Tk thread when it succeeds."""
+        self.task = EditorTask(work, on_done)
+        for button in self.action_buttons:
+            button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        self.task.start()
+        self.poll_task()
+
+    def poll_task(self):
+        """Show the running task's progress, then hand its result back once it finishes."""
+        task = self.task
+        if task.is_alive():
+            percent = f" {task.fraction:.0%}" if task.fraction is not None else ""
+            self.status_label.config(text=f"{task.stage}...{percent}")
+            self.root.after(TASK_POLL_MS, self.poll_task)
+            return
+
+        self.task = None
+        for button in self.action_buttons:
+            button.config(state="normal")
+        self.cancel_button.config(state="disabled")
+        if isinstance(task.error, Cancelled):
+            self.status_label.config(text=f"{task.stage} cancelled")
+        elif task.error is not None:
+            self.status_label.config(text=f"Error: {task.stage} failed - {task.error}")
+        else:
+            task.on_done(task.result)
+
+    def cancel_task(self):
+        if self.task:
+            self.task.cancel()
+            self.status_label.config(text="Cancelling...")
+
     def load_midi_file(self):
         """Load a MIDI file and list channels with checkboxes."""
         file_path = filedialog.askopenfilename(
@@ -83,55 +169,30 @@ class MidiChannelEditor:
         )
         
         if file_path:
-            try:
-                self.midi_file = mido.MidiFile(file_path)
+            with_notes = not self.streaming_var.get()
+
+            def work(task):
+                # Analysis comes from the cache; the editable mido copy is only parsed when first needed
+                task.step("Loading")
+                return self.cache.load(file_path, task.progress, with_notes)
+
+            def done(result):
+                self.analysis, self.notes = result
+                self.midi_file = None
                 self.file_path = file_path
+                self.deleted_channels = set()
                 self.file_label.config(text=f"Selected: {os.path.basename(file_path)}")
                 self.update_channel_list()
+                self.piano_roll.set_notes(self.notes)
                 self.status_label.config(text="File loaded successfully")
-            except Exception as e:
-                self.status_label.config(text=f"Error: Failed to load file - {e}")
-                self.midi_file = None
-                self.file_path = None
-                self.file_label.config(text="No MIDI file selected")
-                self.clear_channel_list()
+
+            self.start_task(work, done)
         
     def get_channel_info(self):
         """Extract channel numbers and their associated names."""
-        if not self.midi_file:
+        if not self.analysis:
             return {}
-        
-        channel_info = {i: f"Channel {i}" for i in range(16)}  # Default names
-        
-        for track_idx, track in enumerate(self.midi_file.tracks):
-            track_name = None
-            channel_programs = {}
-            
-            for msg in track:
-                if msg.type == 'track_name':
-                    track_name = msg.name
-                elif msg.type == 'program_change':
-                    channel = msg.channel
-                    program = msg.program
-                    if 0 <= program < len(GM_INSTRUMENTS):
-                        channel_programs[channel] = GM_INSTRUMENTS[program]
-                elif hasattr(msg, 'channel'):
-                    channel = msg.channel
-                    if channel not in channel_programs and track_name:
-                        channel_programs[channel] = track_name
-            
-            for channel, name in channel_programs.items():
-                channel_info[channel] = f"Ch {channel}: {name}"
-        
-        used_channels = {}
-        for track in self.midi_file.tracks:
-            for msg in track:
-                if hasattr(msg, 'channel'):
-                    channel = msg.channel
-                    if channel in channel_info:
-                        used_channels[channel] = channel_info[channel]
-        
-        return used_channels
+        return self.analysis.channel_names()
         
     def update_channel_list(self):
         """Populate the channel frame with checkboxes."""
@@ -141,13 +202,18 @@ class MidiChannelEditor:
         
         for i, (channel, name) in enumerate(sorted(channel_info.items())):
             var = tk.BooleanVar(value=False)
-            cb = ttk.Checkbutton(self.channel_frame, text=name, variable=var)
+            cb = ttk.Checkbutton(self.channel_frame, text=name, variable=var, command=self.preview_selection)
             cb.grid(row=i, column=0, sticky=tk.W, pady=2)
             self.channel_vars.append((channel, name, var))
         
         # Update canvas scroll region
         self.channel_frame.update_idletasks()
         self.canvas.config(scrollregion=self.canvas.bbox("all"))
+        self.preview_selection()
+
+    def preview_selection(self):
+        """Highlight the checked channels in the piano roll."""
+        self.piano_roll.set_selected(channel for channel, _, var in self.channel_vars if var.get())
         
     def clear_channel_list(self):
         """Clear all checkboxes from the channel frame."""
@@ -157,7 +223,7 @@ class MidiChannelEditor:
         
     def delete_channel(self):
         """Remove all messages for the selected channels."""
-        if not self.midi_file:
+        if not self.analysis:
             self.status_label.config(text="Error: No MIDI file loaded")
             return
         
@@ -172,16 +238,60 @@ class MidiChannelEditor:
             self.status_label.config(text="Error: No channels selected")
             return
         
-        for track in self.midi_file.tracks:
-            new_messages = [msg for msg in track if not (hasattr(msg, 'channel') and msg.channel in channels_to_delete)]
-            track[:] = new_messages
+        delete_set = set(channels_to_delete)
+        midi_file = self.midi_file
+        if self.streaming_var.get() and not midi_file:
+            self.apply_deletion(None, None, delete_set, deleted_names)  # Nothing to rewrite until save
+            return
+
+        file_path = self.file_path
+        deleted_before = set(self.deleted_channels)
+
+        def work(task):
+            if not midi_file:
+                # First edit outside streaming mode: parse now, replaying earlier streaming deletions too
+                task.step("Parsing")
+                parsed = mido.MidiFile(file_path)
+                drop = delete_set | deleted_before
+            else:
+                parsed = midi_file
+                drop = delete_set
+            task.step("Deleting")
+            # New track lists are built aside and only swapped in by apply_deletion, so a cancel changes nothing
+            tracks = []
+            for i, track in enumerate(parsed.tracks):
+                task.progress(i / len(parsed.tracks))
+                new_messages = []
+                carry = 0  # Delta time of removed messages, added to the next kept one
+                for msg in track:
+                    if hasattr(msg, 'channel') and msg.channel in drop:
+                        carry += msg.time
+                        continue
+                    if carry:
+                        msg = msg.copy(time=msg.time + carry)
+                        carry = 0
+                    new_messages.append(msg)
+                tracks.append(new_messages)
+            return parsed, tracks
+
+        self.start_task(work, lambda result: self.apply_deletion(*result, delete_set, deleted_names))
+
+    def apply_deletion(self, midi_file, tracks, delete_set, deleted_names):
+        """Swap in the filtered tracks (if any) and drop the channels from the index."""
+        if midi_file is not None:
+            for track, new_messages in zip(midi_file.tracks, tracks):
+                track[:] = new_messages
+            self.midi_file = midi_file
+        self.deleted_channels |= delete_set
+        self.analysis.remove_channels(delete_set)  # Keep the index in step without a rescan
+        self.piano_roll.set_hidden(self.deleted_channels)
         
         self.update_channel_list()
         self.status_label.config(text=f"Deleted: {', '.join(deleted_names)}")
         
     def save_midi_file(self):
         """Save the edited MIDI file."""
-        if not self.midi_file:
+        if not self.analysis:
             self.status_label.config(text="Error: No MIDI file loaded")
             return
         
@@ -193,11 +303,27 @@ class MidiChannelEditor:
         )
         
         if save_path:
-            try:
-                self.midi_file.save(save_path)
-                self.status_label.config(text=f"Saved as: {os.path.basename(save_path)}")
-            except Exception as e:
-                self.status_label.config(text=f"Error: Failed to save file - {e}")
+            midi_file = self.midi_file
+            file_path = self.file_path
+            deleted_channels = set(self.deleted_channels)
+            piano_prep = self.piano_prep_var.get()
+
+            def work(task):
+                task.step("Saving")
+                if midi_file:
+                    midi_file.save(save_path)
+                else:
+                    filter_channels(file_path, save_path, deleted_channels, task.progress)
+                status = f"Saved as: {os.path.basename(save_path)}"
+                if piano_prep:
+                    task.step("Preparing for piano")
+                    stats = prepare_file(save_path, save_path, progress=task.progress)
+                    status += (f" ({stats['folded']} folded, {stats['merged']} merged, "
+                               f"{stats['restrikes_dropped']} re-strikes dropped, {stats['truncated']} truncated, "
+                               f"{stats['cut_to_nothing']} cut out, {stats['lengthened']} lengthened)")
+                return status
+
+            self.start_task(work, lambda status: self.status_label.config(text=status))
 
 def main():
     try:
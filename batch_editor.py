@@ -0,0 +1,169 @@
+"""Strip channels from every MIDI file in a directory, in parallel.
+
+Uses the same channel index as the MIDI Channel Editor and the streaming
+filter, one file per worker process.
+
+    python batch_editor.py library/ --drop-channel 9
+    python batch_editor.py library/ --keep-programs 0-7 --out piano_library/
+    python batch_editor.py library/ --drop-channel 9 --piano --max-polyphony 10
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from midi_analysis import analyze_bytes
+from midi_stream import MappedFile, filter_channels
+from piano_prep import DEFAULT_MAX_POLYPHONY, DEFAULT_MIN_RESTRIKE_MS, prepare_file
+
+DRUM_CHANNEL = 9  # GM percussion channel (channel 10 counting from 1)
+MIDI_EXTENSIONS = (".mid", ".midi")
+REPORT_FIELDS = ["file", "output", "channels", "dropped_channels", "events_kept", "events_dropped",
+                 "notes_out", "folded", "merged", "restrikes_dropped", "truncated",
+                 "cut_to_nothing", "lengthened", "error"]
+
+
+def parse_program_ranges(text):
+    """'0-7,16' -> {0, 1, ..., 7, 16}"""
+    programs = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            low, high = part.split("-", 1)
+            programs.update(range(int(low), int(high) + 1))
+        else:
+            programs.add(int(part))
+    if not all(0 <= program <= 127 for program in programs):
+        raise ValueError("Programs must be between 0 and 127")
+    return programs
+
+
+def channels_to_drop(analysis, drop_channels=(), keep_programs=None, drop_programs=None):
+    """Pick the channels to remove from a MidiAnalysis according to the rules.
+
+    A channel without a program change is treated as program 0 (the GM
+    default). With keep_programs the drum channel is always dropped, since
+    its program numbers do not select an instrument.
+    """
+    drop = set()
+    for channel, stats in analysis.channels.items():
+        programs = set(stats.programs) or {0}
+        if channel in drop_channels:
+            drop.add(channel)
+        elif keep_programs is not None and (channel == DRUM_CHANNEL or not programs & keep_programs):
+            drop.add(channel)
+        elif drop_programs is not None and channel != DRUM_CHANNEL and programs <= drop_programs:
+            drop.add(channel)
+    return drop
+
+
+def process_file(job):
+    """Worker: filter (and optionally prepare for piano) one file. Returns a report row dict."""
+    src_path, dst_path, rules, piano = job
+    row = {field: "" for field in REPORT_FIELDS}
+    row.update(file=src_path, events_kept=0, events_dropped=0)
+    try:
+        with MappedFile(src_path) as data:
+            analysis = analyze_bytes(data)
+        drop = channels_to_drop(analysis, **rules)
+        row["channels"] = " ".join(str(channel) for channel in sorted(analysis.channels))
+        row["dropped_channels"] = " ".join(str(channel) for channel in sorted(drop))
+        os.makedirs(os.path.dirname(dst_path) or ".", exist_ok=True)
+        row["events_kept"], row["events_dropped"] = filter_channels(src_path, dst_path, drop)
+        if piano is not None:
+            stats = prepare_file(dst_path, dst_path, **piano)
+            row.update((field, stats[field]) for field in ("notes_out", "folded", "merged", "restrikes_dropped", "truncated",
+                                                           "cut_to_nothing", "lengthened"))
+        row["output"] = dst_path
+    except Exception as e:
+        row["error"] = str(e)
+    return row
+
+
+def find_midi_files(directory, recursive=True):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(MIDI_EXTENSIONS):
+                yield os.path.join(root, name)
+        if not recursive:
+            break
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remove channels from all MIDI files in a directory")
+    parser.add_argument("directory", help="Directory of MIDI files")
+    parser.add_argument("--out", help="Output directory (default: <directory>_edited)")
+    parser.add_argument("--drop-channel", type=int, action="append", default=[], metavar="N",
+                        help="Drop channel N (0-15); may be repeated")
+    parser.add_argument("--keep-programs", metavar="RANGES",
+                        help="Keep only channels playing these GM programs, e.g. 0-7 (drums are dropped)")
+    parser.add_argument("--drop-programs", metavar="RANGES",
+                        help="Drop channels that only play these GM programs, e.g. 24-31,40-47")
+    parser.add_argument("--piano", action="store_true",
+                        help="Also fold, merge and thin out notes for the player piano (see piano_prep.py)")
+    parser.add_argument("--max-polyphony", type=int, default=DEFAULT_MAX_POLYPHONY,
+                        help=f"With --piano: most keys held at once (default: {DEFAULT_MAX_POLYPHONY})")
+    parser.add_argument("--min-restrike-ms", type=float, default=DEFAULT_MIN_RESTRIKE_MS,
+                        help=f"With --piano: shortest release-to-strike gap (default: {DEFAULT_MIN_RESTRIKE_MS})")
+    parser.add_argument("--no-recursive", action="store_true", help="Do not descend into subdirectories")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores)")
+    parser.add_argument("--report", help="Summary CSV (default: <out>/batch_report.csv)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+    if not all(0 <= channel <= 15 for channel in args.drop_channel):
+        parser.error("channels must be between 0 and 15")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    try:
+        rules = {
+            "drop_channels": set(args.drop_channel),
+            "keep_programs": parse_program_ranges(args.keep_programs) if args.keep_programs else None,
+            "drop_programs": parse_program_ranges(args.drop_programs) if args.drop_programs else None,
+        }
+    except ValueError as e:
+        parser.error(str(e))
+    if not any(rules.values()) and not args.piano:
+        parser.error("give at least one of --drop-channel, --keep-programs, --drop-programs or --piano")
+    piano = ({"max_polyphony": args.max_polyphony, "min_restrike_ms": args.min_restrike_ms}
+             if args.piano else None)
+
+    source = os.path.normpath(args.directory)
+    out_dir = args.out or source + "_edited"
+    report_path = args.report or os.path.join(out_dir, "batch_report.csv")
+    jobs = [(path, os.path.join(out_dir, os.path.relpath(path, source)), rules, piano)
+            for path in find_midi_files(source, not args.no_recursive)]
+    if not jobs:
+        print("No MIDI files found")
+        return 0
+
+    start = time.perf_counter()
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        for row in pool.map(process_file, jobs, chunksize=max(1, len(jobs) // (args.jobs * 8))):
+            rows.append(row)
+            if row["error"]:
+                print(f"Error: {row['file']}: {row['error']}")
+    elapsed = time.perf_counter() - start
+
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    with open(report_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    failed = sum(1 for row in rows if row["error"])
+    dropped = sum(row["events_dropped"] for row in rows)
+    print(f"Processed {len(rows) - failed} files ({failed} failed) in {elapsed:.1f} s, "
+          f"{dropped} events removed. Report: {report_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+"""Time the keyboard and editor hot paths and save the results as JSON.
+
+Each run writes bench_results/<commit>.json (or --json PATH) with the same
+layout, so two runs can be compared with --compare. Benchmarks that need a
+display are reported as skipped when tkinter is missing or cannot open a window.
+
+    python benchmark.py
+    python benchmark.py --quick --only send,input,sweep
+    python benchmark.py --compare bench_results/1f17b0e.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from statistics import mean, median
+
+import mido
+
+import loopback
+from calibrate import run_sweep
+from calibration_store import CalibrationWriter
+from latency import InFlightTracker, LatencyStats
+from midi_analysis import CHUNK_HEADER, analyze_bytes
+from midi_bytes import FIRST_KEY, note_tables, raw_sender, send_all_notes_off
+from midi_cache import MidiCache
+from midi_stream import MappedFile, filter_channels, write_varlen
+
+BENCH_DIR = "bench_results"
+MIDI_SIZES = [10_000, 100_000, 1_000_000]  # Channel events per synthetic file
+QUICK_MIDI_SIZES = [10_000, 100_000]
+MIDO_MAX_EVENTS = 200_000  # Larger files are only timed on the byte-level paths
+
+
+class Skipped(Exception):
+    """Raised by a benchmark that cannot run here; the message is recorded."""
+
+
+class NullPort:
+    """Output port that accepts pre-encoded bytes and throws them away."""
+
+    def __init__(self):
+        self.count = 0
+
+    def send_raw(self, data):
+        self.count += 1
+
+
+class IdlePortWatcher:
+    """Stands in for PortWatcher: never lists ports, so the saved hardware ports are not opened."""
+
+    inputs = None
+    outputs = None
+
+    def __init__(self, on_change=None):
+        pass
+
+    def start(self):
+        pass
+
+    def refresh(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class EncodingPort:
+    """Output port that encodes mido messages the way a backend does, then drops them."""
+
+    def send(self, message):
+        message.bytes()
+
+
+def time_calls(fn, repeat, number=1):
+    """Seconds per call of fn(), one sample per batch of number calls."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def summarize(samples, unit="us", **extra):
+    """Samples in seconds -> result dict in unit."""
+    scale = {"us": 1e6, "ms": 1e3, "s": 1.0}[unit]
+    values = sorted(sample * scale for sample in samples)
+    result = {
+        "unit": unit,
+        "n": len(values),
+        "median": median(values),
+        "mean": mean(values),
+        "min": values[0],
+        "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+    }
+    result.update(extra)
+    return result
+
+
+def write_synthetic_midi(path, events, tracks=4, seed=0):
+    """Write a type 1 SMF with about `events` note_on/note_off events spread over 16 channels.
+
+    Every channel gets a program change, and each track a name, so the
+    editor's channel list has something to show.
+    """
+    rng = random.Random(seed)
+    per_track = events // tracks
+    with open(path, "wb") as f:
+        f.write(CHUNK_HEADER.pack(b"MThd", 6) + (1).to_bytes(2, "big") + tracks.to_bytes(2, "big")
+                + (480).to_bytes(2, "big"))
+        for track in range(tracks):
+            body = bytearray()
+            name = f"Track {track}".encode()
+            body += b"\x00\xff\x03" + write_varlen(len(name)) + name
+            for channel in range(track, 16, tracks):
+                body += bytes([0, 0xC0 | channel, (channel * 8) % 128])
+            for i in range(per_track // 2):
+                channel = rng.randrange(track, 16, tracks)
+                note = rng.randrange(21, 109)
+                body += write_varlen(rng.randrange(0, 60)) + bytes([0x90 | channel, note, rng.randrange(1, 128)])
+                body += write_varlen(rng.randrange(1, 240)) + bytes([0x80 | channel, note, 0])
+            body += b"\x00\xff\x2f\x00"
+            f.write(CHUNK_HEADER.pack(b"MTrk", len(body)))
+            f.write(body)
+
+
+# --- Benchmarks: each takes the parsed args and returns {result name: result dict} ---
+
+def bench_send(args):
+    """Note on/off send cost: pre-encoded bytes against building a mido.Message per send."""
+    repeat = 20 if args.quick else 100
+    port = NullPort()
+    send = raw_sender(port)
+    note_on, note_off = note_tables(0)
+    tracker = InFlightTracker()
+
+    def prebuilt():
+        for note in range(21, 109):
+            tracker.sent(note, 100)
+            send(note_on[(note - FIRST_KEY) * 128 + 100])
+            send(note_off[(note - FIRST_KEY) * 128])
+
+    encoding = EncodingPort()
+
+    def message_objects():
+        for note in range(21, 109):
+            tracker.sent(note, 100)
+            encoding.send(mido.Message('note_on', note=note, velocity=100))
+            encoding.send(mido.Message('note_off', note=note, velocity=0))
+
+    per_key = 1 / 88  # Report per key press (one note_on plus one note_off)
+    return {
+        "send.key_press.prebuilt": summarize([s * per_key for s in time_calls(prebuilt, repeat)]),
+        "send.key_press.mido_message": summarize([s * per_key for s in time_calls(message_objects, repeat)]),
+        "send.all_notes_off.cc123": summarize(time_calls(lambda: send_all_notes_off(port), repeat, 100)),
+        "send.all_notes_off.88_keys": summarize(time_calls(
+            lambda: send_all_notes_off(port, all_keys=True), repeat, 10)),
+    }
+
+
+def bench_input(args):
+    """Echo handling without Tk: queue the message, pair it with its note_on, update the statistics."""
+    count = 2_000 if args.quick else 20_000
+    tracker = InFlightTracker()
+    stats = LatencyStats()
+    queue = []
+    echoes = [mido.Message('note_on', note=21 + i % 88, velocity=100) for i in range(count)]
+    for i in range(count):
+        tracker.sent(21 + i % 88, 100)
+
+    start = time.perf_counter()
+    for message in echoes:
+        queue.append((time.perf_counter_ns(), message))
+    for received_ns, message in queue:
+        match = tracker.received(message.note, received_ns)
+        if match:
+            stats.add(message.note, match[1])
+    elapsed = time.perf_counter() - start
+    return {"input.echo_to_stats": summarize([elapsed / count], matched=tracker.matched)}
+
+
+def bench_sweep(args):
+    """Full 88-key sweep against the simulated piano."""
+    loopback.configure(seed=1, jitter_ms=2.0)
+    output = loopback.open_output(loopback.SIMULATED_PORT)
+    results = {}
+    for delay_ms in ([10] if args.quick else [10, 50]):
+        start = time.perf_counter()
+        echoes, tracker = run_sweep(output, loopback.SIMULATED_PORT, delay_ms, 100, timeout_ms=500)
+        wall = time.perf_counter() - start
+        ideal = 88 * 2 * delay_ms / 1000
+        results[f"sweep.88_keys.delay_{delay_ms}ms"] = summarize(
+            [wall], unit="s", ideal_s=ideal, echoed=len(echoes), dropped=tracker.drops)
+    return results
+
+
+def bench_midi(args):
+    """Channel listing and deletion on synthetic files of increasing size."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for events in (QUICK_MIDI_SIZES if args.quick else MIDI_SIZES):
+            path = os.path.join(tmp, f"synthetic_{events}.mid")
+            write_synthetic_midi(path, events)
+            size_mb = os.path.getsize(path) / 1e6
+            prefix = f"midi.{events}_events"
+
+            def analyze():
+                with MappedFile(path) as data:
+                    return analyze_bytes(data).channel_names()
+            results[f"{prefix}.get_channel_info"] = summarize(time_calls(analyze, 3), unit="ms", file_mb=size_mb)
+
+            cache = MidiCache(os.path.join(tmp, "cache"))
+            cold = time_calls(lambda: (cache.clear(), cache.load(path)), 1)
+            warm = time_calls(lambda: cache.load(path), 5)
+            results[f"{prefix}.cache_load.cold"] = summarize(cold, unit="ms", file_mb=size_mb)
+            results[f"{prefix}.cache_load.warm"] = summarize(warm, unit="ms", file_mb=size_mb)
+
+            out = os.path.join(tmp, "out.mid")
+            results[f"{prefix}.delete_channel.streaming"] = summarize(
+                time_calls(lambda: filter_channels(path, out, {9}), 3), unit="ms", file_mb=size_mb)
+
+            if events <= MIDO_MAX_EVENTS:
+                def mido_delete():
+                    midi_file = mido.MidiFile(path)
+                    for track in midi_file.tracks:
+                        track[:] = [msg for msg in track if not (hasattr(msg, 'channel') and msg.channel == 9)]
+                    midi_file.save(out)
+                results[f"{prefix}.delete_channel.mido"] = summarize(time_calls(mido_delete, 1), unit="ms",
+                                                                      file_mb=size_mb)
+    return results
+
+
+def bench_gui(args):
+    """Startup, key press, echo-to-table and resize cost in the keyboard window."""
+    try:
+        import tkinter as tk
+        import keyboard  # Tk is only needed here; the other benchmarks run without it
+    except ImportError as e:
+        raise Skipped(f"no tkinter ({e})")
+    try:
+        tk.Tk().destroy()
+    except tk.TclError as e:
+        raise Skipped(f"no display ({e})")
+
+    class BenchKeyboard(keyboard.SynthesiaKeyboard):
+        """Keyboard window without side effects on the working directory."""
+
+        def save_window_size(self):
+            self.save_size_job = None
+
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Swap out the port watcher and calibration log before __init__ creates them
+        saved = keyboard.PortWatcher, keyboard.CalibrationWriter
+        keyboard.PortWatcher = IdlePortWatcher
+        keyboard.CalibrationWriter = lambda: CalibrationWriter(os.path.join(tmp, "calibration.csv"))
+        try:
+            start = time.perf_counter()
+            app = BenchKeyboard()
+            app.update()  # First frame drawn
+            results["gui.startup_to_first_frame"] = summarize([time.perf_counter() - start], unit="ms")
+        finally:
+            keyboard.PortWatcher, keyboard.CalibrationWriter = saved
+
+        port = NullPort()
+        app.midi_output = port
+        app.send_output = raw_sender(port)
+        key_id = app.key_id_map[60]
+        repeat = 50 if args.quick else 500
+
+        def press():
+            app.mouse_pressed = False
+            app.on_key_press(None, key_id)
+            app.on_key_release(None, key_id)
+        results["gui.key_press"] = summarize(time_calls(press, repeat))
+
+        def frame_of_echoes():
+            for i in range(88):
+                app.in_flight.sent(21 + i, 100)
+                app.on_midi_input(mido.Message('note_on', note=21 + i, velocity=100))
+            app.drain_frame()  # Not drain_midi_input, which would start another after() loop
+            app.update_idletasks()
+        results["gui.input_to_table.88_echoes"] = summarize(time_calls(frame_of_echoes, 10 if args.quick else 50),
+                                                            unit="ms")
+
+        sizes = [(800 + 40 * (i % 10), 400 + 20 * (i % 7)) for i in range(20 if args.quick else 100)]
+
+        def resize():
+            width, height = sizes.pop()
+            app.geometry(f"{width}x{height}")
+            app.update_idletasks()
+            app.apply_resize()
+            app.update_idletasks()
+        results["gui.resize_relayout"] = summarize(time_calls(resize, len(sizes)), unit="ms")
+        app.on_close()
+    return results
+
+
+BENCHMARKS = {
+    "send": bench_send,
+    "input": bench_input,
+    "sweep": bench_sweep,
+    "midi": bench_midi,
+    "gui": bench_gui,
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current, previous):
+    """Print median change per result present in both runs."""
+    print(f"\nCompared with {previous.get('commit', '?')}:")
+    for name, result in current["results"].items():
+        before = previous.get("results", {}).get(name)
+        if not before or "median" not in result or "median" not in before or not before["median"]:
+            continue
+        change = result["median"] / before["median"] - 1
+        print(f"  {name:<48} {before['median']:10.3f} -> {result['median']:10.3f} {result['unit']:<2} {change:+7.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the keyboard and editor hot paths")
+    parser.add_argument("--only", help=f"Comma-separated benchmarks to run (default: all of {','.join(BENCHMARKS)})")
+    parser.add_argument("--quick", action="store_true", help="Fewer repeats and smaller files")
+    parser.add_argument("--json", help=f"Results file (default: {BENCH_DIR}/<commit>.json)")
+    parser.add_argument("--compare", metavar="JSON", help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    run = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "results": {},
+        "skipped": {},
+    }
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        try:
+            run["results"].update(BENCHMARKS[name](args))
+        except Skipped as e:
+            run["skipped"][name] = str(e)
+            print(f"  skipped: {e}", file=sys.stderr)
+
+    for result_name, result in run["results"].items():
+        print(f"{result_name:<48} median {result['median']:10.3f} {result['unit']:<2} "
+              f"(min {result['min']:.3f}, p95 {result['p95']:.3f}, n={result['n']})")
+
+    json_path = args.json or os.path.join(BENCH_DIR, f"{run['commit']}.json")
+    os.makedirs(os.path.dirname(json_path) or ".", exist_ok=True)
+    with open(json_path, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"Results saved to {json_path}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(run, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""Headless round-trip calibration sweep (no tkinter).
+
+Uses the ports saved in midi_ports.json by the keyboard window, plays the
+full A0-C8 sweep and writes one row per echoed note.
+
+    python calibrate.py --delay 50 --velocity 127 --results results.csv
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+
+import mido
+
+import loopback
+from calibration_store import CALIBRATION_FILE, CalibrationWriter
+from instrumentation import STAGES_FILE, StageTimer
+from latency import InFlightTracker, LatencyStats
+from midi_bytes import send_all_notes_off
+from response_curve import TABLE_FILE, ResponseTable, velocity_grid
+from sweep import PIANO_NOTES, SweepEngine, note_name
+
+PORTS_FILE = "midi_ports.json"
+
+
+def load_port_settings(path=PORTS_FILE):
+    """Return the (input, output) port names saved by the keyboard window."""
+    try:
+        with open(path, "r") as f:
+            ports = json.load(f)
+            return ports.get("input", ""), ports.get("output", "")
+    except FileNotFoundError:
+        return "", ""
+
+
+def run_sweep(output, input_port_name, delay_ms, velocity, repeats=1, timeout_ms=500, notes=PIANO_NOTES,
+              log=None, velocities=None, stages=None):
+    """Run a sweep and return ([(note, sent_velocity, received_velocity, rt_ms)], tracker).
+
+    If log is a CalibrationWriter every echo is also appended to it as it arrives.
+    If velocities is given every key is struck at each velocity in the grid.
+    If stages is a StageTimer the sweep's sends and echoes are stamped into it.
+    """
+    tracker = InFlightTracker(timeout_ms=timeout_ms)
+    results = []
+
+    def on_midi_input(message):
+        callback_ns = time.perf_counter_ns()
+        if message.type == 'note_on' and message.velocity > 0:
+            match = tracker.received(message.note, callback_ns)
+            if match:
+                seq, rt_ms, sent_velocity = match
+                results.append((message.note, sent_velocity, message.velocity, rt_ms))
+                if log is not None:
+                    log.record(message.note, sent_velocity, message.velocity, rt_ms)
+                if stages is not None:
+                    stages.echoed(seq, callback_ns, time.perf_counter_ns())  # Headless: "UI" is the recorded row
+
+    midi_input = loopback.open_input(input_port_name, callback=on_midi_input) if input_port_name else None
+    try:
+        engine = SweepEngine(output, notes, velocity, delay_ms, tracker=tracker, repeats=repeats,
+                             velocities=velocities, stages=stages)
+        engine.start()
+        engine.join()
+        # Give the last notes time to echo before counting them as dropped
+        deadline = time.perf_counter() + timeout_ms / 1000
+        while tracker.in_flight() and time.perf_counter() < deadline:
+            time.sleep(0.005)
+        tracker.expire(time.perf_counter_ns() + tracker.timeout_ns)
+    finally:
+        if midi_input:
+            midi_input.close()
+    print(f"Sweep finished in {engine.elapsed_s:.2f} s, "
+          f"max scheduling error {engine.max_lateness_us:.0f} us", file=sys.stderr)
+    return results, tracker
+
+
+def write_results(results, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Note Name", "MIDI Note", "Velocity", "Received Velocity", "RT ms"])
+        for note, sent_velocity, received_velocity, rt_ms in results:
+            writer.writerow([note_name(note), note, sent_velocity, received_velocity, f"{rt_ms:.3f}"])
+
+
+def print_summary(stats):
+    """Print per-key RT statistics in ms."""
+    print(f"{'Note':>4} {'MIDI':>4} {'n':>4} {'min':>7} {'median':>7} {'p95':>7} {'p99':>7} {'std':>6} {'out':>4}")
+    for note, s in stats.summaries().items():
+        print(f"{note_name(note):>4} {note:>4} {s['count']:>4} {s['min']:7.2f} {s['median']:7.2f} "
+              f"{s['p95']:7.2f} {s['p99']:7.2f} {s['std']:6.2f} {s['outliers']:>4}")
+
+
+def main(argv=None):
+    saved_input, saved_output = load_port_settings()
+    parser = argparse.ArgumentParser(description="Run a headless round-trip calibration sweep")
+    parser.add_argument("--input", default=saved_input, help="MIDI input port (default: from midi_ports.json)")
+    parser.add_argument("--output", default=saved_output, help="MIDI output port (default: from midi_ports.json)")
+    parser.add_argument("--delay", type=int, default=50, help="Hold/release delay in ms (default: 50)")
+    parser.add_argument("--velocity", type=int, default=127, help="Note velocity 1-127 (default: 127)")
+    parser.add_argument("--repeats", type=int, default=1, help="Number of passes over the keyboard")
+    parser.add_argument("--timeout", type=int, default=500, help="Echo timeout in ms before a note counts as dropped")
+    parser.add_argument("--results", help="Write per-note results to this CSV file")
+    parser.add_argument("--log", default=CALIBRATION_FILE,
+                        help=f"Append every echo to this calibration log (default: {CALIBRATION_FILE})")
+    parser.add_argument("--no-log", action="store_true", help="Do not append to the calibration log")
+    parser.add_argument("--velocity-grid", type=int, metavar="STEPS",
+                        help="Strike every key at STEPS velocities up to 127 and fit a response table")
+    parser.add_argument("--table", default=TABLE_FILE,
+                        help=f"Where to save the fitted response table (default: {TABLE_FILE})")
+    parser.add_argument("--stages", nargs="?", const=STAGES_FILE, metavar="JSON",
+                        help=f"Time each stage of the round trip and save the histograms (default: {STAGES_FILE})")
+    parser.add_argument("--list-ports", action="store_true", help="List MIDI ports and exit")
+    parser.add_argument("--simulate", action="store_true",
+                        help=f"Use the in-process '{loopback.SIMULATED_PORT}' instead of the saved ports")
+    parser.add_argument("--sim-jitter", type=float, default=loopback.DEFAULT_JITTER_MS,
+                        help=f"With --simulate: echo jitter in ms (default: {loopback.DEFAULT_JITTER_MS})")
+    parser.add_argument("--sim-drop-rate", type=float, default=0.0,
+                        help="With --simulate: fraction of notes that never echo (default: 0)")
+    parser.add_argument("--sim-time-scale", type=float, default=1.0,
+                        help="With --simulate: latency multiplier, 0 echoes immediately (default: 1)")
+    parser.add_argument("--seed", type=int, help="With --simulate: random seed for repeatable runs")
+    args = parser.parse_args(argv)
+
+    if args.list_ports:
+        print("Inputs: ", mido.get_input_names())
+        print("Outputs:", mido.get_output_names())
+        print("Simulated:", loopback.SIMULATED_PORT)
+        return 0
+
+    if not 1 <= args.velocity <= 127 or not 0 <= args.delay <= 5000:
+        parser.error("velocity must be 1-127 and delay 0-5000 ms")
+    if args.simulate:
+        args.input = args.output = loopback.SIMULATED_PORT
+        loopback.configure(jitter_ms=args.sim_jitter, drop_rate=args.sim_drop_rate,
+                           time_scale=args.sim_time_scale, seed=args.seed)
+    input_name = args.input if args.input not in ("", "None") else None
+    if not args.output or args.output == "None":
+        parser.error("no MIDI output port configured")
+
+    velocities = velocity_grid(args.velocity_grid) if args.velocity_grid else None
+    log = None if args.no_log else CalibrationWriter(args.log)
+    stages = StageTimer() if args.stages else None
+    try:
+        with loopback.open_output(args.output) as output:
+            results, tracker = run_sweep(output, input_name, args.delay, args.velocity,
+                                         repeats=args.repeats, timeout_ms=args.timeout, log=log,
+                                         velocities=velocities, stages=stages)
+            send_all_notes_off(output)
+    finally:
+        if log is not None:
+            log.close()
+
+    print(f"Sent {tracker.sent_count}, echoed {tracker.matched}, dropped {tracker.drops}")
+    stats = LatencyStats()
+    for note, _, _, rt_ms in results:
+        stats.add(note, rt_ms)
+    print_summary(stats)
+    if args.results:
+        write_results(results, args.results)
+    if velocities:
+        ResponseTable.fit(results).save(args.table)
+        print(f"Response table for velocities {velocities} saved to {args.table}")
+    if stages is not None:
+        print("\n".join(stages.summary_lines()))
+        stages.export(args.stages)
+        print(f"Stage histograms saved to {args.stages}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+import argparse
+import csv
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+
+from sweep import note_name
+
+CALIBRATION_FILE = "calibration_data.csv"
+LEGACY_HEADER = ["Note Name", "MIDI Note", "Velocity"]
+HEADER = LEGACY_HEADER + ["Received Velocity", "RT ms", "Timestamp", "Session"]
+
+STORE_MAGIC = b"PPCAL\x00\x00\x01"
+# magic, row count, session table offset, session table length
+STORE_HEADER = struct.Struct("<8sQQQ")
+NOTE_INDEX_SIZE = 129  # Row offset of each MIDI note 0-127, plus the end
+# Column name, array typecode; fixed-width little-endian columns in this order
+STORE_COLUMNS = [("timestamp", "d"), ("rt_ms", "f"), ("session", "I"),
+                 ("note", "B"), ("sent_velocity", "B"), ("received_velocity", "B")]
+
+
+def upgrade_legacy_csv(path):
+    """Rewrite an old Note Name,MIDI Note,Velocity file with the current header.
+
+    Old rows keep their values; the new columns are left empty.
+    """
+    with open(path, "r", newline="") as f:
+        rows = list(csv.reader(f))
+    if not rows or rows[0] != LEGACY_HEADER:
+        return False
+    padding = [""] * (len(HEADER) - len(LEGACY_HEADER))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(row + padding for row in rows[1:])
+    os.replace(tmp_path, path)
+    return True
+
+
+class CalibrationWriter:
+    """Append calibration results to a CSV file from a background thread.
+
+    record() only appends to an in-memory deque, so it is cheap enough to call
+    from the MIDI callback or the Tk loop. A writer thread flushes the pending
+    rows in batches every flush_interval seconds (or sooner once batch_size
+    rows are waiting).
+    """
+
+    def __init__(self, path=CALIBRATION_FILE, flush_interval=0.5, batch_size=256):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = deque()
+        self.wake = threading.Event()
+        self.closed = False
+        self.rows_written = 0
+        self.session = None
+        self.start_session()
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            upgrade_legacy_csv(path)
+            self.file = open(path, "a", newline="")
+            self.writer = csv.writer(self.file)
+        else:
+            self.file = open(path, "w", newline="")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(HEADER)
+            self.file.flush()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def start_session(self):
+        """Start a new session id so separate sweeps can be told apart."""
+        now = time.time()
+        self.session = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f".{int(now * 1000) % 1000:03d}"
+        return self.session
+
+    def record(self, note, sent_velocity, received_velocity, rt_ms, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        self.pending.append((note, sent_velocity, received_velocity, rt_ms, timestamp, self.session))
+        if len(self.pending) >= self.batch_size:
+            self.wake.set()
+
+    def run(self):
+        while not self.closed:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        rows = []
+        while self.pending:
+            note, sent_velocity, received_velocity, rt_ms, timestamp, session = self.pending.popleft()
+            rows.append([note_name(note), note, sent_velocity, received_velocity,
+                         f"{rt_ms:.3f}", f"{timestamp:.3f}", session])
+        if rows:
+            self.writer.writerows(rows)
+            self.file.flush()
+            self.rows_written += len(rows)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wake.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+
+
+def _align8(offset):
+    return (offset + 7) & ~7
+
+
+def read_csv_rows(path):
+    """Yield (note, sent_velocity, received_velocity, rt_ms, timestamp, session) from a calibration CSV.
+
+    Legacy rows without RT/timestamp come back with rt_ms NaN, timestamp 0,
+    received velocity 0 and session "legacy".
+    """
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Header
+        for row in reader:
+            if len(row) < 3:
+                continue
+            row += [""] * (len(HEADER) - len(row))
+            _, note, sent_velocity, received_velocity, rt_ms, timestamp, session = row[:7]
+            yield (int(note), int(sent_velocity), int(received_velocity or 0),
+                   float(rt_ms) if rt_ms else math.nan, float(timestamp or 0), session or "legacy")
+
+
+def write_store(path, rows):
+    """Write rows to the columnar binary format.
+
+    Rows are sorted by (note, timestamp) so each note's results form one
+    contiguous slice of every column, located through a 129-entry note index.
+    """
+    if sys.byteorder != "little":
+        raise ValueError("Calibration store files are little-endian")
+    rows = sorted(rows, key=lambda r: (r[0], r[4]))
+    sessions = {}
+    columns = {name: array(typecode) for name, typecode in STORE_COLUMNS}
+    note_index = array("Q", [0] * NOTE_INDEX_SIZE)
+    for note, sent_velocity, received_velocity, rt_ms, timestamp, session in rows:
+        columns["timestamp"].append(timestamp)
+        columns["rt_ms"].append(rt_ms)
+        columns["session"].append(sessions.setdefault(session, len(sessions)))
+        columns["note"].append(note)
+        columns["sent_velocity"].append(sent_velocity)
+        columns["received_velocity"].append(received_velocity)
+        note_index[note + 1] += 1
+    for note in range(1, NOTE_INDEX_SIZE):
+        note_index[note] += note_index[note - 1]
+
+    session_blob = json.dumps(list(sessions)).encode()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"\x00" * STORE_HEADER.size)  # Patched once the session table offset is known
+        f.write(note_index.tobytes())
+        for name, _ in STORE_COLUMNS:
+            f.write(b"\x00" * (_align8(f.tell()) - f.tell()))
+            f.write(columns[name].tobytes())
+        session_offset = f.tell()
+        f.write(session_blob)
+        f.seek(0)
+        f.write(STORE_HEADER.pack(STORE_MAGIC, len(rows), session_offset, len(session_blob)))
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+def convert_csv(csv_path=CALIBRATION_FILE, store_path=None):
+    """Convert a calibration CSV (legacy or current) to a binary store file."""
+    if store_path is None:
+        store_path = os.path.splitext(csv_path)[0] + ".ppcal"
+    return write_store(store_path, read_csv_rows(csv_path))
+
+
+class CalibrationStore:
+    """Memory-mapped read access to a binary calibration store.
+
+    Columns are exposed as typed memoryviews over the mapping, so opening a
+    file costs a header read regardless of how many rows it holds. Per-note
+    queries return zero-copy slices.
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise ValueError("Calibration store files are little-endian")
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, session_offset, session_length = STORE_HEADER.unpack_from(self.map, 0)
+        if magic != STORE_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a calibration store file")
+        self.map_views()
+        self.sessions = json.loads(self.map[session_offset:session_offset + session_length])
+
+    def map_views(self):
+        """Create the note index and column views over the mapping."""
+        view = memoryview(self.map)
+        offset = STORE_HEADER.size
+        self.note_index = view[offset:offset + NOTE_INDEX_SIZE * 8].cast("Q")
+        offset += NOTE_INDEX_SIZE * 8
+        self.columns = {}
+        for name, typecode in STORE_COLUMNS:
+            offset = _align8(offset)
+            size = self.count * array(typecode).itemsize
+            self.columns[name] = view[offset:offset + size].cast(typecode)
+            offset += size
+        view.release()
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def note_range(self, note):
+        """(start, end) row range holding the results for one MIDI note."""
+        return self.note_index[note], self.note_index[note + 1]
+
+    def column(self, name, note=None):
+        """A whole column, or just the slice for one note."""
+        values = self.columns[name]
+        if note is None:
+            return values
+        start, end = self.note_range(note)
+        return values[start:end]
+
+    def rt_ms(self, note):
+        """Measured round-trip times for a note, skipping legacy rows without one."""
+        return [rt for rt in self.column("rt_ms", note) if rt == rt]
+
+    def session_name(self, session_id):
+        return self.sessions[session_id]
+
+    def close(self):
+        """Unmap the file. Slices returned by column() must be dropped first.
+
+        While one is still alive this raises BufferError and the store stays open.
+        """
+        # Typed views must be released before the mapping can be closed
+        for values in getattr(self, "columns", {}).values():
+            values.release()
+        if hasattr(self, "note_index"):
+            self.note_index.release()
+        try:
+            self.map.close()
+        except BufferError:
+            self.map_views()  # Put the views back so the store is still usable
+            raise
+        self.columns = {}
+        self.file.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert calibration CSV data to the binary store format")
+    parser.add_argument("csv", nargs="?", default=CALIBRATION_FILE, help=f"Input CSV (default: {CALIBRATION_FILE})")
+    parser.add_argument("store", nargs="?", help="Output file (default: same name with .ppcal)")
+    args = parser.parse_args(argv)
+    count = convert_csv(args.csv, args.store)
+    print(f"Wrote {count} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""Per-stage timing of the send -> echo round trip.
+
+A key press or sweep note is stamped when the event arrives, when its
+message is encoded and when send() returns; its echo is stamped when the
+input callback runs and when the GUI has drawn the update. The gaps go into
+one LogHistogram per stage, so the software share of a round trip can be
+told apart from the time spent in the driver, cable and solenoid:
+
+    gui_to_encode     event received -> message bytes ready
+    encode_to_send    bytes ready -> send() returned
+    send_to_callback  send() returned -> input callback entered (driver + hardware)
+    callback_to_ui    input callback entered -> update drawn
+    round_trip        event received -> update drawn
+
+Histograms can be written to a JSON file or served at
+http://127.0.0.1:<port>/stages by serve().
+"""
+import json
+import math
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUB_BUCKET_BITS = 5  # 32 buckets per power of two: values are kept to within ~3%
+MAX_VALUE_NS = 1 << 36  # ~69 s; anything slower is counted in the top bucket
+STAGES = ["gui_to_encode", "encode_to_send", "send_to_callback", "callback_to_ui", "round_trip"]
+SOFTWARE_STAGES = ["gui_to_encode", "encode_to_send", "callback_to_ui"]
+MAX_PENDING = 4096  # Sent notes remembered while waiting for their echo
+STAGES_FILE = "latency_stages.json"
+
+
+class LogHistogram:
+    """HDR-style histogram of non-negative integers (nanoseconds).
+
+    Values below 2**(SUB_BUCKET_BITS + 1) are counted exactly; above that
+    each power of two is split into 2**SUB_BUCKET_BITS equal buckets, so
+    recording is a couple of integer operations and an array increment.
+    """
+
+    def __init__(self, sub_bucket_bits=SUB_BUCKET_BITS, max_value=MAX_VALUE_NS):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.max_value = max_value
+        self.counts = array("Q", bytes(8 * (self.index(max_value) + 1)))
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def index(self, value):
+        shift = max(value.bit_length() - self.sub_bucket_bits - 1, 0)
+        return (shift << self.sub_bucket_bits) + (value >> shift)
+
+    def bucket_range(self, index):
+        """(lowest, highest) value counted in a bucket."""
+        shift = max((index >> self.sub_bucket_bits) - 1, 0)
+        mantissa = index - (shift << self.sub_bucket_bits)
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def record(self, value):
+        value = min(max(int(value), 0), self.max_value)
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Upper edge of the bucket holding the p-th percentile, None when empty."""
+        if not self.count:
+            return None
+        target = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.bucket_range(index)[1], self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def reset(self):
+        self.counts = array("Q", bytes(8 * len(self.counts)))
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def to_dict(self, scale=1e-6):
+        """Summary plus the non-empty buckets as [low, high, count], values multiplied by scale (ns -> ms)."""
+        def scaled(value):
+            return value * scale if value is not None else None
+        return {
+            "count": self.count,
+            "mean": scaled(self.mean()),
+            "min": scaled(self.min),
+            "max": scaled(self.max),
+            "p50": scaled(self.percentile(50)),
+            "p90": scaled(self.percentile(90)),
+            "p99": scaled(self.percentile(99)),
+            "p999": scaled(self.percentile(99.9)),
+            "buckets": [[low * scale, high * scale, count]
+                        for (low, high), count in ((self.bucket_range(index), count)
+                                                   for index, count in enumerate(self.counts) if count)],
+        }
+
+
+class StageTimer:
+    """Pair send-side and echo-side stamps by the InFlightTracker sequence number.
+
+    All stamps are time.perf_counter_ns() values. sent() may be called from
+    the sweep thread while echoed() runs on the Tk thread, so both take a lock.
+    """
+
+    def __init__(self):
+        self.histograms = {stage: LogHistogram() for stage in STAGES}
+        self.pending = {}  # seq -> (event_ns, encoded_ns, sent_ns)
+        self.lock = threading.Lock()
+
+    def sent(self, seq, event_ns, encoded_ns, sent_ns):
+        if seq is None:
+            return
+        with self.lock:
+            self.pending[seq] = (event_ns, encoded_ns, sent_ns)
+            if len(self.pending) > MAX_PENDING:
+                del self.pending[next(iter(self.pending))]  # Oldest; its echo never came
+
+    def echoed(self, seq, callback_ns, ui_ns):
+        with self.lock:
+            stamps = self.pending.pop(seq, None)
+            if stamps is None:
+                return
+            event_ns, encoded_ns, sent_ns = stamps
+            histograms = self.histograms
+            histograms["gui_to_encode"].record(encoded_ns - event_ns)
+            histograms["encode_to_send"].record(sent_ns - encoded_ns)
+            histograms["send_to_callback"].record(callback_ns - sent_ns)
+            histograms["callback_to_ui"].record(ui_ns - callback_ns)
+            histograms["round_trip"].record(ui_ns - event_ns)
+
+    def reset(self):
+        with self.lock:
+            self.pending.clear()
+            for histogram in self.histograms.values():
+                histogram.reset()
+
+    def to_dict(self):
+        with self.lock:
+            stages = {stage: histogram.to_dict() for stage, histogram in self.histograms.items()}
+        means = {stage: values["mean"] or 0.0 for stage, values in stages.items()}
+        return {
+            "unit": "ms",
+            "timestamp": time.time(),
+            "software_mean": sum(means[stage] for stage in SOFTWARE_STAGES),
+            "hardware_mean": means["send_to_callback"],
+            "stages": stages,
+        }
+
+    def summary_lines(self):
+        """One line per stage with count, median, p99 and mean in ms."""
+        values = self.to_dict()
+        lines = []
+        for stage, stats in values["stages"].items():
+            if stats["count"]:
+                lines.append(f"{stage:<17} n={stats['count']:<6} p50 {stats['p50']:8.3f}  p99 {stats['p99']:8.3f}"
+                             f"  mean {stats['mean']:8.3f} ms")
+        lines.append(f"software {values['software_mean']:.3f} ms, driver + hardware {values['hardware_mean']:.3f} ms")
+        return lines
+
+    def export(self, path=STAGES_FILE):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve the histograms as JSON at http://host:port/stages on a daemon thread."""
+        timer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/stages"):
+                    self.send_error(404)
+                    return
+                body = json.dumps(timer.to_dict()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep polling out of the console
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Latency stages at http://{host}:{server.server_address[1]}/stages")
+        return server
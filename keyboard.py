@@ -1,11 +1,47 @@
 import tkinter as tk
-from tkinter import ttk
+from tkinter import filedialog, ttk
+from tkinter import font as tkfont
 import mido
 import time
 import json  # Import json module
-import csv  # Import csv module
+from collections import deque
+from calibration_store import CalibrationWriter
+import loopback
+from instrumentation import STAGES_FILE, StageTimer
+from latency import InFlightTracker, LatencyStats
+from midi_bytes import FIRST_KEY, note_tables, raw_sender, send_all_notes_off
+from playback import PlaybackEngine
+from port_manager import PortSlot, PortWatcher
+from sweep import NOTE_NAMES, SweepEngine, note_name
+
+MIDI_QUEUE_SIZE = 4096  # Incoming messages buffered between UI frames
+UI_FRAME_MS = 16  # Drain incoming MIDI at ~60 fps
+TABLE_COLUMNS = 8
+TABLE_ROWS = 11  # 8 columns of 11 rows fit all 88 keys
+TABLE_COLUMN_WIDTH = 150  # Minimum column width in pixels
+TABLE_PADDING = 3
+TABLE_FONT = ("TkDefaultFont", 12)
+TABLE_FONT_BOLD = ("TkDefaultFont", 12, "bold")
+TABLE_DEFAULT = ("|--|--", "white")  # Values text and colour of an unmeasured row
+ROW_HIGHLIGHT_BG = "#404040"  # Darker grey for the hovered key's row
+HEATMAP_FAST_MS = 25  # Keys at or below this RT are drawn green
+HEATMAP_SLOW_MS = 75  # ... and at or above this red, the same threshold as the table
+HEATMAP_STEPS = 32  # Colours in the green-yellow-red scale
+RESIZE_SETTLE_MS = 500  # Save the window size once it has stopped changing for this long
+STAGES_HTTP_PORT = None  # e.g. 8765 to serve the stage histograms at http://127.0.0.1:8765/stages
+NOTE_OFF_ALL_KEYS = False  # Note Off also sends a note_off per key, for instruments that ignore CC 123
+
+
+def heatmap_palette(steps=HEATMAP_STEPS):
+    """Fill colours from green through yellow to red"""
+    colors = []
+    for i in range(steps):
+        t = i / (steps - 1)
+        red = int(255 * min(1.0, 2 * t))
+        green = int(200 * min(1.0, 2 * (1 - t)))
+        colors.append(f"#{red:02x}{green:02x}00")
+    return colors
 
-NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
 
 class SynthesiaKeyboard(tk.Tk):
     def __init__(self):
@@ -13,6 +49,9 @@ class SynthesiaKeyboard(tk.Tk):
         self.title("Standlee Player Piano")
         self.geometry("800x400")  # Initial window size
         self.bind("<Configure>", self.on_resize)
+        self.last_size = None
+        self.resize_job = None  # Pending relayout, at most one per frame
+        self.save_size_job = None  # Pending window_size.json write once resizing settles
 
         self.canvas = tk.Canvas(self, bg="black")
         self.canvas.pack(fill=tk.BOTH, expand=True, anchor=tk.SW)
@@ -25,6 +64,12 @@ class SynthesiaKeyboard(tk.Tk):
 
         self.active_keys = {}
         self.key_colors = {}  # New dictionary to store original colors
+        self.key_id_map = {}  # MIDI note -> key_id
+        self.heatmap_on = False  # Tint keys by measured RT instead of plain white/black
+        self.heatmap_palette = heatmap_palette()
+        self.heat_colors = {}  # key_id -> heatmap colour of keys with a measurement
+        self.heat_dirty = set()  # key_ids whose heatmap colour changed this frame
+        self.key_shapes = {}  # key_id -> (left, right, is_black) in white-key widths
         self.pressed_keys = set()  # Add this to track currently pressed keys
 
         self.load_window_size()  # Load saved window size
@@ -36,6 +81,10 @@ class SynthesiaKeyboard(tk.Tk):
         self.draw_keyboard()
         self.midi_output = None
         self.midi_input = None
+        self.send_output = None  # Raw byte writer for midi_output
+        self.note_on_table, self.note_off_table = note_tables(0)  # Encoded once, indexed by key and velocity
+        self.input_slot = PortSlot(lambda name: loopback.open_input(name, callback=self.on_midi_input))
+        self.output_slot = PortSlot(loopback.open_output)
         self.create_note_table()  # Create table first
         self.create_midi_controls()
         self.create_status_labels()
@@ -48,21 +97,33 @@ class SynthesiaKeyboard(tk.Tk):
         self.indicator_color = "green"  # Initialize the indicator color
         self.create_indicator_rect()  # Create the indicator rectangle
 
-        self.start_time = None  # Initialize start time for round trip calculation
+        self.in_flight = InFlightTracker()  # Pending notes waiting for their echo
+        self.latency_stats = LatencyStats()  # Per-key RT statistics across repeated sweeps
+        self.stages = StageTimer()  # Where the time in each round trip goes, software vs hardware
+        if STAGES_HTTP_PORT:
+            self.stages.serve(STAGES_HTTP_PORT)
+        self.midi_queue = deque(maxlen=MIDI_QUEUE_SIZE)  # Filled by the MIDI thread, drained by Tk
+        self.midi_overflow = 0  # Messages discarded because the queue was full
+        self.sweep = None  # Running SweepEngine, if any
+        self.sweep_events = deque()  # Visual updates posted by the sweep thread
+        self.playback = None  # Running PlaybackEngine, if any
+        self.playback_events = deque()  # Visual updates posted by the playback thread
+        self.calibration_log = CalibrationWriter()  # Appends every measured echo to calibration_data.csv
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
         self.midi_input_dropdown.bind('<<ComboboxSelected>>', self.update_midi_ports)
         self.midi_output_dropdown.bind('<<ComboboxSelected>>', self.update_midi_ports)
-        # Start checking MIDI status immediately
-        self.check_midi_status()
+        # Port lists come from a background watcher; the saved ports connect as soon as they are listed
+        self.port_events = deque()  # Port list changes posted by the watcher thread
+        self.port_watcher = PortWatcher(on_change=lambda inputs, outputs: self.port_events.append((inputs, outputs)))
+        self.port_watcher.start()
+        self.drain_midi_input()
 
         self.is_playing = False
         self.current_key_index = 0
         self.sorted_keys = []
         self.delay_ms = 50  # Default delay
 
-        # Add this after loading ports
-        self.after(100, self.update_midi_ports)  # Auto-connect on startup
-
         # Add hover label with large font
         self.hover_label = tk.Label(self, 
                                text="Hover: None", 
@@ -91,13 +152,28 @@ class SynthesiaKeyboard(tk.Tk):
             self.indicator_text = self.canvas.create_text((x0 + x1) // 2, (y0 + y1) // 2, text=str(self.indicator_counter), fill="white")
 
     def on_resize(self, event):
-        self.save_window_size()  # Save window size on resize
-        self.canvas.delete("all")
-        self.draw_keyboard()
-        self.create_indicator_rect()  # Recreate the indicator rectangle after drawing the keyboard
+        # <Configure> also fires for every child widget; only the window itself matters
+        if event.widget is not self or not hasattr(self, 'indicator_rect'):
+            return
+        size = (event.width, event.height)
+        if size == self.last_size:
+            return
+        self.last_size = size
+        # Relayout at most once per frame, and only save the size once resizing has settled
+        if self.resize_job is None:
+            self.resize_job = self.after(UI_FRAME_MS, self.apply_resize)
+        if self.save_size_job is not None:
+            self.after_cancel(self.save_size_job)
+        self.save_size_job = self.after(RESIZE_SETTLE_MS, self.save_window_size)
+
+    def apply_resize(self):
+        self.resize_job = None
+        self.layout_keyboard()
+        self.create_indicator_rect()  # Move the indicator rectangle to the new centre
         self.update_table_position()
 
     def save_window_size(self):
+        self.save_size_job = None
         size = {
             "width": self.winfo_width(),
             "height": self.winfo_height()
@@ -114,30 +190,16 @@ class SynthesiaKeyboard(tk.Tk):
             pass
 
     def draw_keyboard(self):
-        width = self.winfo_width()
-        height = self.winfo_height() // 4  # 1/4 of the window height (increased height)
-        white_key_width = width / 52  # 52 white keys
-        black_key_width = white_key_width * 2 / 3  # Black keys are narrower
-        black_key_height = height * 3 / 5  # Black keys are shorter
-
+        """Create the key rectangles once; layout_keyboard positions them"""
         # Draw blue line above the keyboard
-        self.canvas.create_line(0, self.winfo_height() - height - 2, width, self.winfo_height() - height - 2, fill="blue", width=4)
+        self.keyboard_line = self.canvas.create_line(0, 0, 0, 0, fill="blue", width=4)
 
         # Draw white keys
         white_key_notes = [21, 23, 24, 26, 28, 29, 31, 33, 35, 36, 38, 40, 41, 43, 45, 47, 48, 50, 52, 53, 55, 57, 59, 60, 62, 64, 65, 67, 69, 71, 72, 74, 76, 77, 79, 81, 83, 84, 86, 88, 89, 91, 93, 95, 96, 98, 100, 101, 103, 105, 107, 108]  # MIDI note numbers for white keys starting from A0
         for i, note in enumerate(white_key_notes):
-            x0 = i * white_key_width
-            x1 = x0 + white_key_width
-            y0 = self.winfo_height() - height
-            y1 = self.winfo_height()
-            key_id = self.canvas.create_rectangle(x0, y0, x1, y1, fill="white", outline="black")
-            # Add more robust mouse event handling
-            self.canvas.tag_bind(key_id, "<ButtonPress-1>", lambda e, k=key_id: self.on_key_press(e, k))
-            self.canvas.tag_bind(key_id, "<ButtonRelease-1>", lambda e, k=key_id: self.on_key_release(e, k))
-            self.canvas.tag_bind(key_id, "<Enter>", lambda e, k=key_id: self.on_mouse_enter(e, k))
-            self.canvas.tag_bind(key_id, "<Leave>", lambda e, k=key_id: self.on_mouse_leave(e, k))
-            self.active_keys[key_id] = note  # Assign MIDI note number
-            self.key_colors[key_id] = "white"  # Store original color
+            key_id = self.canvas.create_rectangle(0, 0, 0, 0, fill="white", outline="black")
+            self.key_shapes[key_id] = (i, i + 1, False)  # Left/right edge in white-key widths
+            self.bind_key(key_id, note, "white")
 
         # Draw black keys
         black_key_notes = [22, 25, 27, 30, 32, 34, 37, 39, 42, 44, 46, 49, 51, 54, 56, 58, 61, 63, 66, 68, 70, 73, 75, 78, 80, 82, 85, 87, 90, 92, 94, 97, 99, 102, 104, 106]  # MIDI note numbers for black keys
@@ -145,32 +207,36 @@ class SynthesiaKeyboard(tk.Tk):
         for i, note in enumerate(black_key_notes):
             octave = i // 5
             pos = i % 5
-            x0 = (octave * 7 + black_key_positions[pos]) * white_key_width - black_key_width / 2
-            x1 = x0 + black_key_width
-            y0 = self.winfo_height() - height
-            y1 = y0 + black_key_height
-            key_id = self.canvas.create_rectangle(x0, y0, x1, y1, fill="black", outline="white")
-            # Add more robust mouse event handling
-            self.canvas.tag_bind(key_id, "<ButtonPress-1>", lambda e, k=key_id: self.on_key_press(e, k))
-            self.canvas.tag_bind(key_id, "<ButtonRelease-1>", lambda e, k=key_id: self.on_key_release(e, k))
-            self.canvas.tag_bind(key_id, "<Enter>", lambda e, k=key_id: self.on_mouse_enter(e, k))
-            self.canvas.tag_bind(key_id, "<Leave>", lambda e, k=key_id: self.on_mouse_leave(e, k))
-            self.active_keys[key_id] = note  # Assign MIDI note number
-            self.key_colors[key_id] = "black"  # Store original color
-            
+            center = octave * 7 + black_key_positions[pos]
+            key_id = self.canvas.create_rectangle(0, 0, 0, 0, fill="black", outline="white")
+            self.key_shapes[key_id] = (center - 1 / 3, center + 1 / 3, True)  # Black keys are 2/3 as wide
+            self.bind_key(key_id, note, "black")
+
+        self.layout_keyboard()
 
-        # Draw the last black key in the 8th octave
-        x0 = 7 * 7 * white_key_width + black_key_positions[0] * white_key_width - black_key_width / 2
-        x1 = x0 + black_key_width
-        y0 = self.winfo_height() - height
-        y1 = y0 + black_key_height
-        key_id = self.canvas.create_rectangle(x0, y0, x1, y1, fill="black", outline="white")
+    def bind_key(self, key_id, note, color):
+        # Add more robust mouse event handling
         self.canvas.tag_bind(key_id, "<ButtonPress-1>", lambda e, k=key_id: self.on_key_press(e, k))
         self.canvas.tag_bind(key_id, "<ButtonRelease-1>", lambda e, k=key_id: self.on_key_release(e, k))
         self.canvas.tag_bind(key_id, "<Enter>", lambda e, k=key_id: self.on_mouse_enter(e, k))
         self.canvas.tag_bind(key_id, "<Leave>", lambda e, k=key_id: self.on_mouse_leave(e, k))
-        self.active_keys[key_id] = 106  # Assign MIDI note number for the last black key
-        self.key_colors[key_id] = "black"  # Store original color
+        self.active_keys[key_id] = note  # Assign MIDI note number
+        self.key_colors[key_id] = color  # Store original color
+        self.key_id_map[note] = key_id
+
+    def layout_keyboard(self):
+        """Move the existing key items to fit the current window size"""
+        width = self.winfo_width()
+        window_height = self.winfo_height()
+        height = window_height // 4  # 1/4 of the window height (increased height)
+        white_key_width = width / 52  # 52 white keys
+        black_key_height = height * 3 / 5  # Black keys are shorter
+        top = window_height - height
+
+        self.canvas.coords(self.keyboard_line, 0, top - 2, width, top - 2)
+        for key_id, (left, right, is_black) in self.key_shapes.items():
+            bottom = top + black_key_height if is_black else window_height
+            self.canvas.coords(key_id, left * white_key_width, top, right * white_key_width, bottom)
 
     def create_midi_controls(self):
         control_frame = tk.Frame(self, bg="black")
@@ -183,7 +249,7 @@ class SynthesiaKeyboard(tk.Tk):
         # MIDI Input Dropdown
         self.midi_input_var = tk.StringVar()
         self.midi_input_dropdown = ttk.Combobox(control_frame, textvariable=self.midi_input_var)
-        self.midi_input_dropdown['values'] = ["None"] + mido.get_input_names()
+        self.midi_input_dropdown['values'] = ["None"]  # Filled in by the port watcher
         self.midi_input_dropdown.grid(row=0, column=1, padx=5, pady=5)
 
         # MIDI Input Status Circle
@@ -198,7 +264,7 @@ class SynthesiaKeyboard(tk.Tk):
         # MIDI Output Dropdown
         self.midi_output_var = tk.StringVar()
         self.midi_output_dropdown = ttk.Combobox(control_frame, textvariable=self.midi_output_var)
-        self.midi_output_dropdown['values'] = ["None"] + mido.get_output_names()
+        self.midi_output_dropdown['values'] = ["None"]
         self.midi_output_dropdown.grid(row=1, column=1, padx=5, pady=5)
 
         # MIDI Output Status Circle
@@ -230,6 +296,21 @@ class SynthesiaKeyboard(tk.Tk):
                               bg="gray", fg="black", width=10, font=('TkDefaultFont', 9, 'bold'))
         self.note_off_button.grid(row=2, column=6, padx=5, pady=5)  # Place after Clear button
 
+        # Add Play button for latency-compensated MIDI file playback
+        self.play_button = tk.Button(control_frame, text="Play", command=self.toggle_playback,
+                              bg="gray", fg="black", width=10, font=('TkDefaultFont', 9, 'bold'))
+        self.play_button.grid(row=2, column=7, padx=5, pady=5)  # Place after Note Off button
+
+        # Add Heatmap button to tint the keys by their measured round trip time
+        self.heatmap_button = tk.Button(control_frame, text="Heatmap", command=self.toggle_heatmap,
+                              bg="gray", fg="black", width=10, font=('TkDefaultFont', 9, 'bold'))
+        self.heatmap_button.grid(row=2, column=8, padx=5, pady=5)  # Place after Play button
+
+        # Add Stages button to print and save where the round trip time goes
+        self.stages_button = tk.Button(control_frame, text="Stages", command=self.export_stages,
+                              bg="gray", fg="black", width=10, font=('TkDefaultFont', 9, 'bold'))
+        self.stages_button.grid(row=2, column=9, padx=5, pady=5)  # Place after Heatmap button
+
         # Add velocity slider after the delay controls
         velocity_frame = tk.Frame(control_frame, bg="black")
         velocity_frame.grid(row=3, column=0, columnspan=6, padx=5, pady=5, sticky='ew')
@@ -316,55 +397,43 @@ class SynthesiaKeyboard(tk.Tk):
                                         font=label_font)
         self.round_trip_label.grid(row=2, column=0, padx=5, pady=5)
 
-    def check_midi_status(self): 
-        input_name = self.midi_input_var.get()
-        output_name = self.midi_output_var.get()        
-        
-        # Simplified connection checks
-        input_connected = (input_name != "None" and input_name in mido.get_input_names() 
-                         and self.midi_input is not None)
-        output_connected = (output_name != "None" and output_name in mido.get_output_names() 
-                          and self.midi_output is not None)
-
-        self.midi_input_status.itemconfig(1, fill="green" if input_connected else "red")
-        self.midi_output_status.itemconfig(1, fill="green" if output_connected else "red")
-
-        self.after(1000, self.check_midi_status)
+    def check_midi_status(self):
+        self.midi_input_status.itemconfig(1, fill="green" if self.midi_input is not None else "red")
+        self.midi_output_status.itemconfig(1, fill="green" if self.midi_output is not None else "red")
+
+    def apply_port_lists(self, inputs, outputs):
+        """New port lists from the watcher: refresh the dropdowns and reconnect"""
+        print("\n=== MIDI Ports Changed ===")
+        print(f"Available inputs: {inputs}")
+        print(f"Available outputs: {outputs}")
+        self.midi_input_dropdown['values'] = ["None"] + inputs + [loopback.SIMULATED_PORT]
+        self.midi_output_dropdown['values'] = ["None"] + outputs + [loopback.SIMULATED_PORT]
+        self.connect_ports()
+
+    def connect_ports(self):
+        """Open or close only the ports whose selection or availability changed"""
+        if self.port_watcher.inputs is None:
+            return  # Not enumerated yet; the first port list will connect
+        self.input_slot.wanted = self.midi_input_var.get()
+        self.output_slot.wanted = self.midi_output_var.get()
+        self.input_slot.sync(self.port_watcher.inputs + [loopback.SIMULATED_PORT])
+        if self.output_slot.sync(self.port_watcher.outputs + [loopback.SIMULATED_PORT]):
+            # Running engines hold the old port object
+            if self.sweep:
+                self.sweep.stop()
+            if self.playback:
+                self.playback.stop()
+        self.midi_input = self.input_slot.port
+        self.midi_output = self.output_slot.port
+        self.send_output = raw_sender(self.midi_output) if self.midi_output else None
+        self.check_midi_status()
 
     def update_midi_ports(self, *args):
-        print("\n=== MIDI Port Update ===")
-        print(f"Available inputs: {mido.get_input_names()}")
-        print(f"Available outputs: {mido.get_output_names()}")
-        
-        if self.midi_input:
-            print(f"Closing existing input: {self.midi_input}")
-            self.midi_input.close()
-            self.midi_input = None
-        if self.midi_output:
-            print(f"Closing existing output: {self.midi_output}")
-            self.midi_output.close()
-            self.midi_output = None
-
-        input_name = self.midi_input_var.get()
-        output_name = self.midi_output_var.get()
-        
-        print(f"Attempting to connect to input: {input_name}")
-        print(f"Attempting to connect to output: {output_name}")
-
-        try:
-            if input_name != "None" and input_name in mido.get_input_names():
-                self.midi_input = mido.open_input(input_name, callback=self.on_midi_input)
-                print(f"Successfully connected to input: {input_name}")
-            if output_name != "None" and output_name in mido.get_output_names():
-                self.midi_output = mido.open_output(output_name)
-                print(f"Successfully connected to output: {output_name}")
-        except Exception as e:
-            print(f"Error connecting to MIDI ports: {str(e)}")
-
+        self.connect_ports()
         self.save_midi_ports()
-        self.check_midi_status()
 
     def on_key_click(self, event, key_id):
+        event_ns = time.perf_counter_ns()  # GUI event received
         self.canvas.itemconfig(key_id, fill="blue")
         self.indicator_color = "blue"  # Change indicator color to blue
         self.canvas.itemconfig(self.indicator_rect, fill=self.indicator_color)  # Change indicator rectangle to blue
@@ -376,8 +445,11 @@ class SynthesiaKeyboard(tk.Tk):
                 octave = (note // 12) - 1
                 self.key_status_label.config(text=f"Key Pressed: {NOTE_NAMES[note % 12]}{octave}, Velocity: {velocity}")
                 if self.midi_output:
-                    self.start_time = time.time()  # Start time for round trip calculation
-                    self.midi_output.send(mido.Message('note_on', note=note, velocity=velocity))
+                    data = self.note_on_table[(note - FIRST_KEY) * 128 + velocity]
+                    encoded_ns = time.perf_counter_ns()
+                    seq = self.in_flight.sent(note, velocity)  # Start time for round trip calculation
+                    self.send_output(data)
+                    self.stages.sent(seq, event_ns, encoded_ns, time.perf_counter_ns())
             
             self.active_keys[key_id] = note  # Ensure the key remains active
         self.refresh_window()  # Refresh the window
@@ -387,7 +459,7 @@ class SynthesiaKeyboard(tk.Tk):
         # Rest of existing on_key_release code...
         if key_id in self.pressed_keys:  # Only process if key was actually pressed
             self.pressed_keys.remove(key_id)
-            original_color = self.key_colors[key_id]  # Use key_colors to get the original color
+            original_color = self.key_fill(key_id)  # Original color, or its heatmap tint
             self.canvas.itemconfig(key_id, fill=original_color)
             self.indicator_color = "green"  # Change indicator color to green
             self.canvas.itemconfig(self.indicator_rect, fill=self.indicator_color)  # Change indicator rectangle to green
@@ -395,26 +467,76 @@ class SynthesiaKeyboard(tk.Tk):
           
             if note is not None and 0 <= note <= 127:
                 if self.midi_output:
-                    self.midi_output.send(mido.Message('note_off', note=note, velocity=0))  # Set velocity to 0
+                    self.send_output(self.note_off_table[(note - FIRST_KEY) * 128])  # Velocity 0
             self.active_keys[key_id] = note  # Ensure the key remains active
  
 
     def on_midi_input(self, message):
-        if message.type == 'note_on' and message.velocity > 0:
-            note_name = NOTE_NAMES[message.note % 12]
-            octave = (message.note // 12) - 1
-            velocity = message.velocity
-            self.midi_status_label.config(text=f"MIDI Input: {note_name}{octave}, Velocity: {velocity}")
-            if self.start_time:
-                round_trip_time_s = time.time() - self.start_time  # Calculate time difference in seconds
-                round_trip_time_ms = round_trip_time_s * 1000  # Convert to milliseconds
-                self.round_trip_label.config(text=f"Round Trip Time: {round_trip_time_ms:.2f} ms")
-                self.update_note_table(message.note, message.velocity, round_trip_time_ms)  # Update the table
-                self.start_time = None  # Reset start time
-        elif message.type == 'note_off' or (message.type == 'note_on' and message.velocity == 0):
-            note_name = NOTE_NAMES[message.note % 12]
-            octave = (message.note // 12) - 1
-        
+        """Runs on the MIDI backend thread: timestamp and queue only, no Tk calls"""
+        if len(self.midi_queue) == MIDI_QUEUE_SIZE:
+            self.midi_overflow += 1  # deque drops the oldest entry on append
+        self.midi_queue.append((time.perf_counter_ns(), message))
+
+    def drain_midi_input(self):
+        """Apply queued MIDI input to the GUI once per frame"""
+        self.drain_frame()
+        self.after(UI_FRAME_MS, self.drain_midi_input)
+
+    def drain_frame(self):
+        """One frame's worth of queued input, engine events and port changes"""
+        latest = None
+        updates = {}  # note -> (velocity, round trip ms), last one wins within a frame
+        echoed = []  # (seq, callback ns) of matched echoes, for the stage timer
+        while self.midi_queue:
+            received_ns, message = self.midi_queue.popleft()
+            if message.type == 'note_on' and message.velocity > 0:
+                latest = message
+                match = self.in_flight.received(message.note, received_ns)  # Pair the echo with its own outgoing note
+                if match:
+                    seq, round_trip_time_ms, sent_velocity = match
+                    echoed.append((seq, received_ns))
+                    updates[message.note] = (message.velocity, round_trip_time_ms)
+                    self.latency_stats.add(message.note, round_trip_time_ms)
+                    self.calibration_log.record(message.note, sent_velocity, message.velocity, round_trip_time_ms)
+
+        if latest is not None:
+            note_name = NOTE_NAMES[latest.note % 12]
+            octave = (latest.note // 12) - 1
+            self.midi_status_label.config(text=f"MIDI Input: {note_name}{octave}, Velocity: {latest.velocity}")
+        if updates:
+            drops = self.in_flight.drops
+            drop_text = f" ({drops} dropped)" if drops else ""
+            if self.midi_overflow:
+                drop_text += f" ({self.midi_overflow} lost to input queue overflow)"
+            self.round_trip_label.config(text=f"Round Trip Time: {round_trip_time_ms:.2f} ms{drop_text}")
+            for note, (velocity, return_time) in updates.items():
+                self.update_note_table(note, velocity, return_time)  # Update the table
+        if echoed:
+            self.after_idle(self.record_stages, echoed)  # Idle callbacks run after the redraw just queued
+
+        while self.sweep_events:
+            self.apply_sweep_event(*self.sweep_events.popleft())
+        while self.playback_events:
+            self.apply_playback_event(*self.playback_events.popleft())
+        if self.heat_dirty:
+            self.flush_heatmap()
+        if self.port_events:
+            while len(self.port_events) > 1:
+                self.port_events.popleft()  # Only the newest port lists matter
+            self.apply_port_lists(*self.port_events.popleft())
+
+    def record_stages(self, echoed):
+        """Stamp this frame's echoes as drawn"""
+        ui_ns = time.perf_counter_ns()
+        for seq, callback_ns in echoed:
+            self.stages.echoed(seq, callback_ns, ui_ns)
+
+    def export_stages(self):
+        """Print the per-stage breakdown and save the histograms"""
+        print("\n".join(self.stages.summary_lines()))
+        self.stages.export(STAGES_FILE)
+        print(f"Stage histograms saved to {STAGES_FILE}")
+
     def get_note_and_octave_from_key_id(self, key_id):
         note = self.active_keys.get(key_id)
         print(key_id)
@@ -428,63 +550,58 @@ class SynthesiaKeyboard(tk.Tk):
         self.update_idletasks()
 
     def create_note_table(self):
-        self.table_frame = tk.Frame(self, bg="grey", relief="raised", borderwidth=1)
+        """Draw the 88-row note table as text items on a single canvas"""
+        self.table_canvas = tk.Canvas(self, bg="grey", relief="raised", borderwidth=1, highlightthickness=0)
+        self.table_column_width = TABLE_COLUMN_WIDTH  # Columns share the window width, but no narrower than this
+        self.highlighted_row = None  # Row under the hovered key
         self.update_table_position()
 
-        # Increase columns and adjust rows per column
-        num_columns = 8  # Increased from 6 to 8
-        rows_per_column = 11  # Adjusted from 15 to 11 to fit all 88 keys
-
-        # Configure grid columns to be equal with increased width
-        for i in range(num_columns):
-            self.table_frame.grid_columnconfigure(i, weight=1, minsize=150)  # Increased from 130 to 150
-
-        # Header labels with larger font
-        header_text = "Note|MIDI|V|RT"
-        for col in range(num_columns):
-            header = tk.Label(self.table_frame, text=header_text,
-                             fg="black", bg="grey", anchor='w',
-                             font=("TkDefaultFont", 12, 'bold'))  # Increased from 8 to 12
-            header.grid(row=0, column=col, sticky='w', padx=3, pady=2)  # Slightly increased padding
-
-        # Create note rows with larger font
-        self.note_list_rows = []
+        bold_font = tkfont.Font(font=TABLE_FONT_BOLD)
+        plain_font = tkfont.Font(font=TABLE_FONT)
+        self.table_row_height = plain_font.metrics("linespace") + 6
+        # Fixed offsets inside a cell so every row lines up as Note|MIDI|V|RT
+        separator_x = max(bold_font.measure(note_name(note)) for note in range(21, 109))
+        midi_x = separator_x + plain_font.measure("|")
+        values_x = midi_x + plain_font.measure("108")
+
+        # Hover highlight: one rectangle moved behind the hovered row
+        self.row_highlight = self.table_canvas.create_rectangle(0, 0, 0, 0, fill=ROW_HIGHLIGHT_BG, width=0,
+                                                                state="hidden")
+        for col in range(TABLE_COLUMNS):
+            self.table_canvas.create_text(self.table_cell_x(col), self.table_row_y(-1), text="Note|MIDI|V|RT",
+                                          fill="black", anchor='w', font=TABLE_FONT_BOLD, tags=f"col{col}")
+
+        self.table_values = []  # Values text item of each row
         for i in range(88):
             midi_note = i + 21
-            note_name = NOTE_NAMES[midi_note % 12]
-            octave = (midi_note // 12) - 1
-            
-            row_frame = tk.Frame(self.table_frame, bg="black")
-            row_frame.grid(row=i % rows_per_column + 1, column=i // rows_per_column, 
-                          sticky='w', padx=3, pady=1)
-            
-            # Note name in bold blue
-            note_label = tk.Label(row_frame, text=f"{note_name}{octave}", 
-                                fg="blue", bg="grey", 
-                                font=("TkDefaultFont", 12, "bold"))  # Increased from 8 to 12
-            note_label.pack(side=tk.LEFT)
-            
-            # Separator
-            tk.Label(row_frame, text="|", fg="black", bg="grey",
-                    font=("TkDefaultFont", 12)).pack(side=tk.LEFT)  # Increased from 8 to 12
-            
-            # MIDI note in red
-            midi_label = tk.Label(row_frame, text=str(midi_note),
-                                fg="red", bg="grey",
-                                font=("TkDefaultFont", 12))  # Increased from 8 to 12
-            midi_label.pack(side=tk.LEFT)
-            
-            # Values section in white
-            values_label = tk.Label(row_frame, text="|--|--",
-                                  fg="white", bg="grey",
-                                  font=("TkDefaultFont", 12))  # Increased from 8 to 12
-            values_label.pack(side=tk.LEFT)
-            
-            self.note_list_rows.append((note_label, midi_label, values_label))
+            col, row = divmod(i, TABLE_ROWS)
+            x = self.table_cell_x(col)
+            y = self.table_row_y(row)
+            tags = f"col{col}"  # Moved as one when the column width changes
+            self.table_canvas.create_text(x, y, text=note_name(midi_note), fill="blue", anchor='w',
+                                          font=TABLE_FONT_BOLD, tags=tags)
+            self.table_canvas.create_text(x + separator_x, y, text="|", fill="black",
+                                          anchor='w', font=TABLE_FONT, tags=tags)
+            self.table_canvas.create_text(x + midi_x, y, text=str(midi_note), fill="red", anchor='w',
+                                          font=TABLE_FONT, tags=tags)
+            self.table_values.append(self.table_canvas.create_text(x + values_x, y, text=TABLE_DEFAULT[0],
+                                                                   fill=TABLE_DEFAULT[1], anchor='w',
+                                                                   font=TABLE_FONT, tags=tags))
+
+        # Only rows that differ from the defaults are touched again
+        self.row_values = [TABLE_DEFAULT] * 88  # (text, fg) shown in each values item
+        self.dirty_rows = set()  # Rows showing a measurement, reset by clear_table
+
+    def table_cell_x(self, col):
+        return col * self.table_column_width + TABLE_PADDING
+
+    def table_row_y(self, row):
+        """Centre line of a table row; row -1 is the header"""
+        return (row + 1.5) * self.table_row_height
 
     def update_table_position(self):
         """Recalculate and update table position"""
-        if hasattr(self, 'table_frame'):
+        if hasattr(self, 'table_canvas'):
             keyboard_height = self.winfo_height() // 4
             control_height = 150  # Approximate height of control frame
             
@@ -492,24 +609,58 @@ class SynthesiaKeyboard(tk.Tk):
             y_pos = control_height
             table_height = self.winfo_height() - keyboard_height - control_height - 4
             
-            self.table_frame.place(x=0, y=y_pos, relwidth=1.0, height=table_height)
+            self.table_canvas.place(x=0, y=y_pos, relwidth=1.0, height=table_height)
+
+            # Shift whole columns if their width changed; the items themselves are never rebuilt
+            column_width = max(TABLE_COLUMN_WIDTH, self.winfo_width() / TABLE_COLUMNS)
+            if column_width != self.table_column_width:
+                for col in range(1, TABLE_COLUMNS):
+                    self.table_canvas.move(f"col{col}", col * (column_width - self.table_column_width), 0)
+                self.table_column_width = column_width
+                if self.highlighted_row is not None:
+                    self.place_row_highlight(self.highlighted_row)
 
     def update_note_table(self, note, velocity, return_time=None):
         # Calculate the index for the note (A0 = MIDI 21, so index = note - 21)
         index = note - 21
         if 0 <= index < 88:
-            note_name = NOTE_NAMES[note % 12]
-            octave = (note // 12) - 1
-            return_time_text = f"{return_time:.1f}" if return_time is not None else "N/A"  # Shortened decimal
-            
-            # Update each part with appropriate styling
-            note_label, midi_label, values_label = self.note_list_rows[index]
-            values_label.config(text=f"|{velocity}|{return_time_text}")
-            
-            # Change text color to red if roundtrip time exceeds 100ms, otherwise white
+            # Show median/p95 over all repetitions once there is more than one sample
+            stats = self.latency_stats.summary(note)
+            if stats and stats["count"] > 1:
+                return_time_text = f"{stats['median']:.1f}/{stats['p95']:.1f}"
+                return_time = stats["p95"]
+            else:
+                return_time_text = f"{return_time:.1f}" if return_time is not None else "N/A"  # Shortened decimal
+
+            # Change text color to black if roundtrip time exceeds 75ms, otherwise white
+            text_color = self.row_values[index][1]
             if return_time is not None:
                 text_color = "black" if return_time > 75 else "white"
-                values_label.config(fg=text_color)
+            if return_time is not None:
+                self.set_key_heat(note, return_time)
+            value = (f"|{velocity}|{return_time_text}", text_color)
+            if value != self.row_values[index]:
+                self.row_values[index] = value
+                self.table_canvas.itemconfig(self.table_values[index], text=value[0], fill=value[1])
+            self.dirty_rows.add(index)
+
+    def highlight_row(self, index):
+        """Move the hover highlight to a table row (None for no row)"""
+        if index == self.highlighted_row:
+            return
+        if index is None:
+            self.table_canvas.itemconfig(self.row_highlight, state="hidden")
+        else:
+            self.place_row_highlight(index)
+            self.table_canvas.itemconfig(self.row_highlight, state="normal")
+        self.highlighted_row = index
+
+    def place_row_highlight(self, index):
+        col, row = divmod(index, TABLE_ROWS)
+        x = self.table_cell_x(col)
+        y = self.table_row_y(row)
+        half = self.table_row_height / 2 - 1
+        self.table_canvas.coords(self.row_highlight, x - 2, y - half, x + self.table_column_width - 2 * TABLE_PADDING, y + half)
 
     def simulate_first_key(self):
         # Get delay from entry field
@@ -520,41 +671,79 @@ class SynthesiaKeyboard(tk.Tk):
             self.delay_ms = 50
             self.delay_entry.delete(0, tk.END)
             self.delay_entry.insert(0, str(self.delay_ms))
-            
+
+        if not self.midi_output:
+            print("No MIDI output connected")
+            return
+
         # Create a sorted list of MIDI notes and find their corresponding key_ids
         self.midi_notes = sorted(list(set(self.active_keys.values())))  # Get unique sorted MIDI notes
         self.key_id_map = {note: key_id for key_id, note in self.active_keys.items()}  # Map notes to key_ids
-        self.current_test_index = 0
-        
+
         print(f"Starting test sequence with {len(self.midi_notes)} notes")
+        self.calibration_log.start_session()  # Keep each sweep separate in calibration_data.csv
         # Disable test button during playback
         self.test_button.config(state="disabled")
-        self.test_next_key()
-
-    def test_next_key(self):
-        if self.current_test_index >= len(self.midi_notes):
-            print("Finished testing all keys")
+        # Timing runs on the sweep thread; it only posts visual updates back to us
+        self.sweep = SweepEngine(self.midi_output, self.midi_notes, self.get_velocity(), self.delay_ms,
+                                 tracker=self.in_flight, stages=self.stages,
+                                 on_event=lambda kind, note: self.sweep_events.append((kind, note)))
+        self.sweep.start()
+
+    def apply_sweep_event(self, kind, note):
+        """Mirror a note sent by the sweep thread on the keyboard"""
+        if kind == 'done':
+            print(f"Finished testing all keys (max scheduling error {self.sweep.max_lateness_us:.0f} us)")
             self.test_button.config(state="normal")
+            self.sweep = None
             return
-            
-        note = self.midi_notes[self.current_test_index]
-        key_id = self.key_id_map[note]
-        mock_event = type('Event', (), {'x': 0, 'y': 0})()
-        
-        # Use existing key press logic
-        self.on_key_click(mock_event, key_id)
-        
-        # Schedule release after delay
-        self.after(self.delay_ms, lambda: self.release_key_and_continue(mock_event, key_id))
-
-    def release_key_and_continue(self, event, key_id):
-        """Handle key release and schedule next key"""
-        # Use existing release logic
-        self.on_key_release(event, key_id)
-        
-        # Wait for full delay before next key
-        self.current_test_index += 1
-        self.after(self.delay_ms, self.test_next_key)
+        key_id = self.key_id_map.get(note)
+        if key_id is None:
+            return
+        if kind == 'on':
+            self.canvas.itemconfig(key_id, fill="blue")
+            self.indicator_color = "blue"
+            octave = (note // 12) - 1
+            self.key_status_label.config(text=f"Key Pressed: {NOTE_NAMES[note % 12]}{octave}, Velocity: {self.sweep.velocity}")
+        else:
+            self.canvas.itemconfig(key_id, fill=self.key_fill(key_id))
+            self.indicator_color = "green"
+        self.canvas.itemconfig(self.indicator_rect, fill=self.indicator_color)
+
+    def toggle_playback(self):
+        """Start playing a MIDI file, or stop the one that is playing"""
+        if self.playback:
+            self.playback.stop()
+            return
+        if not self.midi_output:
+            print("No MIDI output connected")
+            return
+        file_path = filedialog.askopenfilename(title="Select MIDI File",
+                                               filetypes=[("MIDI files", "*.mid *.midi")])
+        if not file_path:
+            return
+        try:
+            midi_file = mido.MidiFile(file_path)
+        except Exception as e:
+            print(f"Error loading MIDI file: {e}")
+            return
+        self.key_id_map = {note: key_id for key_id, note in self.active_keys.items()}  # Map notes to key_ids
+        self.playback = PlaybackEngine(self.midi_output, midi_file,
+                                       on_event=lambda kind, note: self.playback_events.append((kind, note)))
+        print(f"Playing {file_path} ({self.playback.event_count} events)")
+        self.play_button.config(text="Stop")
+        self.playback.start()
+
+    def apply_playback_event(self, kind, note):
+        """Mirror a note sent by the playback thread on the keyboard"""
+        if kind == 'done':
+            print(f"Playback finished (max scheduling error {self.playback.max_lateness_us:.0f} us)")
+            self.play_button.config(text="Play")
+            self.playback = None
+            return
+        key_id = self.key_id_map.get(note)
+        if key_id is not None:
+            self.canvas.itemconfig(key_id, fill="blue" if kind == 'on' else self.key_fill(key_id))
 
     def on_key_press(self, event, key_id):
         """Modified to prevent duplicate presses"""
@@ -569,13 +758,7 @@ class SynthesiaKeyboard(tk.Tk):
             self.on_key_click(event, key_id)
 
     def on_mouse_leave(self, event, key_id):
-        # Reset highlight when mouse leaves any key
-        for note_label, midi_label, values_label in self.note_list_rows:
-            note_label.config(bg="grey")
-            midi_label.config(bg="grey")
-            values_label.config(bg="grey")
-        
-        self.update_hover_label(None)
+        self.update_hover_label(None)  # Also removes the row highlight
         if key_id in self.pressed_keys:
             self.on_key_release(event, key_id)
 
@@ -589,13 +772,52 @@ class SynthesiaKeyboard(tk.Tk):
 
     def clear_table(self):
         """Clear all values in the note table"""
-        for _, _, values_label in self.note_list_rows:
-            values_label.config(text="|--|--", fg="white")  # Reset text and color
+        for index in self.dirty_rows:  # Only rows that were written since the last clear
+            self.table_canvas.itemconfig(self.table_values[index], text=TABLE_DEFAULT[0], fill=TABLE_DEFAULT[1])
+            self.row_values[index] = TABLE_DEFAULT
+        self.dirty_rows.clear()
+        if self.heatmap_on:
+            self.heat_dirty.update(self.heat_colors)  # Back to plain white/black on the next frame
+        self.heat_colors.clear()
         
         # Reset status labels
         self.key_status_label.config(text="Key Pressed: None")
         self.midi_status_label.config(text="MIDI Input: None")
         self.round_trip_label.config(text="Round Trip Time: N/A")
+        self.in_flight.reset()
+        self.latency_stats.reset()
+        self.stages.reset()
+
+    def key_fill(self, key_id):
+        """Resting colour of a key: its heatmap tint when shown, else white/black"""
+        if self.heatmap_on:
+            return self.heat_colors.get(key_id, self.key_colors[key_id])
+        return self.key_colors[key_id]
+
+    def set_key_heat(self, note, return_time):
+        """Record a key's RT colour; the canvas is repainted once per frame by flush_heatmap"""
+        key_id = self.key_id_map.get(note)
+        if key_id is None:
+            return
+        t = (return_time - HEATMAP_FAST_MS) / (HEATMAP_SLOW_MS - HEATMAP_FAST_MS)
+        color = self.heatmap_palette[round(min(max(t, 0.0), 1.0) * (HEATMAP_STEPS - 1))]
+        if self.heat_colors.get(key_id) != color:
+            self.heat_colors[key_id] = color
+            if self.heatmap_on:
+                self.heat_dirty.add(key_id)
+
+    def flush_heatmap(self):
+        """Repaint only the keys whose colour changed since the last frame"""
+        for key_id in self.heat_dirty:
+            if key_id not in self.pressed_keys:
+                self.canvas.itemconfig(key_id, fill=self.key_fill(key_id))
+        self.heat_dirty.clear()
+
+    def toggle_heatmap(self):
+        self.heatmap_on = not self.heatmap_on
+        self.heatmap_button.config(relief="sunken" if self.heatmap_on else "raised")
+        self.heat_dirty.update(self.heat_colors)  # Only measured keys change colour
+        self.flush_heatmap()
 
     def update_velocity_label(self, event=None):
         value = self.velocity_value.get()
@@ -606,32 +828,39 @@ class SynthesiaKeyboard(tk.Tk):
         return int((self.velocity_value.get() / 100) * 127)
 
     def send_all_notes_off(self):
-        """Send note-off messages for all possible MIDI notes"""
+        """Send All Notes Off (CC 123), optionally followed by a note_off for every key"""
         if self.midi_output:
-            for note in range(21, 109):  # MIDI notes from A0 (21) to C8 (108)
-                self.midi_output.send(mido.Message('note_off', note=note, velocity=0))
+            send_all_notes_off(self.midi_output, all_keys=NOTE_OFF_ALL_KEYS)
             print("All notes off sent")
 
     def update_hover_label(self, note):
-        # Reset previous highlight if any
-        for _, _, values_label in self.note_list_rows:
-            values_label.config(bg="grey")  # Reset all backgrounds to default
-            
         if note is None:
             self.hover_label.config(text="Hover: None")
+            self.highlight_row(None)
         else:
             note_name = NOTE_NAMES[note % 12]
             octave = (note // 12) - 1
-            self.hover_label.config(text=f"Hover: {note_name}{octave} ({note})")
+            hover_text = f"Hover: {note_name}{octave} ({note})"
+            stats = self.latency_stats.summary(note)
+            if stats:
+                hover_text += (f"  n={stats['count']} min {stats['min']:.1f} med {stats['median']:.1f}"
+                               f" p95 {stats['p95']:.1f} p99 {stats['p99']:.1f}"
+                               f" sd {stats['std']:.1f} outliers {stats['outliers']}")
+            self.hover_label.config(text=hover_text)
             
             # Highlight the corresponding table row
             index = note - 21  # Convert MIDI note to table index
-            if 0 <= index < 88:
-                note_label, midi_label, values_label = self.note_list_rows[index]
-                # Highlight the entire row
-                note_label.config(bg="#404040")  # Darker grey for highlight
-                midi_label.config(bg="#404040")
-                values_label.config(bg="#404040")
+            self.highlight_row(index if 0 <= index < 88 else None)
+
+    def on_close(self):
+        """Flush pending calibration rows before the window goes away"""
+        if self.sweep:
+            self.sweep.stop()
+        if self.playback:
+            self.playback.stop()
+        self.port_watcher.stop()
+        self.calibration_log.close()
+        self.destroy()
 
 if __name__ == "__main__":
     app = SynthesiaKeyboard()
@@ -0,0 +1,225 @@
+import threading
+import time
+from collections import deque
+
+DEFAULT_TIMEOUT_MS = 500  # Echoes slower than this are counted as drops
+
+
+class InFlightTracker:
+    """Track outgoing notes until their echo comes back.
+
+    Each sent note_on is stored per MIDI note with a sequence number and a
+    perf_counter_ns timestamp, so overlapping notes (chords, fast sweeps)
+    are paired with their own echo instead of whichever arrives first.
+    Safe to call from the GUI thread and the MIDI callback thread.
+    """
+
+    def __init__(self, timeout_ms=DEFAULT_TIMEOUT_MS):
+        self.timeout_ns = int(timeout_ms * 1_000_000)
+        self.pending = {}  # note -> deque of (seq, sent_ns, velocity)
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.sent_count = 0
+        self.matched = 0
+        self.drops = 0
+
+    def sent(self, note, velocity, sent_ns=None):
+        """Record a note_on that is about to be sent. Returns its sequence number."""
+        if sent_ns is None:
+            sent_ns = time.perf_counter_ns()
+        with self.lock:
+            self._expire(sent_ns)
+            self.seq += 1
+            self.sent_count += 1
+            self.pending.setdefault(note, deque()).append((self.seq, sent_ns, velocity))
+            return self.seq
+
+    def received(self, note, received_ns=None):
+        """Match an echoed note_on to the oldest pending send of the same note.
+
+        Returns (seq, round_trip_ms, sent_velocity), or None if nothing was
+        waiting for this note (unsolicited input or already timed out).
+        """
+        if received_ns is None:
+            received_ns = time.perf_counter_ns()
+        with self.lock:
+            self._expire(received_ns)
+            queue = self.pending.get(note)
+            if not queue:
+                return None
+            seq, sent_ns, velocity = queue.popleft()
+            if not queue:
+                del self.pending[note]
+            self.matched += 1
+        return seq, (received_ns - sent_ns) / 1_000_000, velocity
+
+    def expire(self, now_ns=None):
+        """Drop sends that have waited longer than the timeout. Returns the number dropped."""
+        if now_ns is None:
+            now_ns = time.perf_counter_ns()
+        with self.lock:
+            return self._expire(now_ns)
+
+    def _expire(self, now_ns):
+        deadline = now_ns - self.timeout_ns
+        dropped = 0
+        for note in list(self.pending):
+            queue = self.pending[note]
+            while queue and queue[0][1] < deadline:
+                queue.popleft()
+                dropped += 1
+            if not queue:
+                del self.pending[note]
+        self.drops += dropped
+        return dropped
+
+    def in_flight(self):
+        """Number of sends still waiting for an echo."""
+        with self.lock:
+            return sum(len(queue) for queue in self.pending.values())
+
+    def reset(self):
+        with self.lock:
+            self.pending.clear()
+            self.seq = 0
+            self.sent_count = 0
+            self.matched = 0
+            self.drops = 0
+
+
+class P2Quantile:
+    """Streaming quantile estimate in constant memory (P-squared algorithm, Jain & Chlamtac 1985)."""
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        h = self.heights
+        if len(h) < 5:
+            h.append(x)
+            if len(h) == 5:
+                h.sort()
+            return
+
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= h[k + 1]:
+                k += 1
+
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Move the three middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = h[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+                if h[i - 1] < parabolic < h[i + 1]:
+                    h[i] = parabolic
+                else:
+                    h[i] += d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def value(self):
+        h = self.heights
+        if not h:
+            return None
+        if len(h) < 5:
+            ordered = sorted(h)
+            return ordered[min(len(ordered) - 1, int(self.p * len(ordered)))]
+        return h[2]
+
+
+class KeyLatencyStats:
+    """Running round-trip statistics for one key in constant memory."""
+
+    OUTLIER_SIGMA = 3.0  # Samples further than this many std devs from the mean
+    OUTLIER_MIN_SAMPLES = 10  # Don't flag outliers before the mean has settled
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Welford sum of squared differences
+        self.min = None
+        self.max = None
+        self.last = None
+        self.outliers = 0
+        self.median = P2Quantile(0.5)
+        self.p95 = P2Quantile(0.95)
+        self.p99 = P2Quantile(0.99)
+
+    def add(self, rt_ms):
+        if self.count >= self.OUTLIER_MIN_SAMPLES and abs(rt_ms - self.mean) > self.OUTLIER_SIGMA * self.std():
+            self.outliers += 1
+        self.count += 1
+        delta = rt_ms - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (rt_ms - self.mean)
+        self.min = rt_ms if self.min is None else min(self.min, rt_ms)
+        self.max = rt_ms if self.max is None else max(self.max, rt_ms)
+        self.last = rt_ms
+        self.median.add(rt_ms)
+        self.p95.add(rt_ms)
+        self.p99.add(rt_ms)
+
+    def std(self):
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean if self.count else None,
+            "std": self.std(),
+            "median": self.median.value(),
+            "p95": self.p95.value(),
+            "p99": self.p99.value(),
+            "last": self.last,
+            "outliers": self.outliers,
+        }
+
+
+class LatencyStats:
+    """Per-note KeyLatencyStats for every key that has produced an echo."""
+
+    def __init__(self):
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def add(self, note, rt_ms):
+        with self.lock:
+            stats = self.keys.get(note)
+            if stats is None:
+                stats = self.keys[note] = KeyLatencyStats()
+            stats.add(rt_ms)
+
+    def summary(self, note):
+        """Stats dict for one note, or None if it has no samples yet."""
+        with self.lock:
+            stats = self.keys.get(note)
+            return stats.summary() if stats else None
+
+    def summaries(self):
+        with self.lock:
+            return {note: stats.summary() for note, stats in sorted(self.keys.items())}
+
+    def reset(self):
+        with self.lock:
+            self.keys.clear()
@@ -0,0 +1,194 @@
+"""In-process stand-in for the player piano's MIDI loopback.
+
+LoopbackPiano plays the part of the output/input port pair saved in
+midi_ports.json: note_ons written to its output come back on its input after
+a per-key latency, with jitter, random drops and the piano's velocity
+response. Latency and velocity curves come from a ResponseTable, so a model
+fitted from calibration_data.csv behaves like the real instrument; keys
+without data use base_latency_ms.
+
+open_input()/open_output() take the same arguments as mido's and return the
+shared simulator for SIMULATED_PORT, so the keyboard, calibrate.py and
+playback.py can run a sweep without any hardware.
+"""
+import heapq
+import random
+import threading
+import time
+
+import mido
+
+from response_curve import load_latency_table
+from sweep import SPIN_S
+
+SIMULATED_PORT = "Simulated Piano"
+DEFAULT_LATENCY_MS = 40.0  # Keys the table knows nothing about
+DEFAULT_JITTER_MS = 2.0  # Standard deviation added to every echo
+
+_default_piano = None
+_default_settings = {}
+
+
+class LoopbackPiano(threading.Thread):
+    """Echo note_ons back to every open input after a simulated actuation latency.
+
+    time_scale multiplies all latencies; 0 echoes as fast as the thread can
+    run. sent/echoed/dropped count note_ons since the start.
+    """
+
+    def __init__(self, table=None, base_latency_ms=DEFAULT_LATENCY_MS, jitter_ms=DEFAULT_JITTER_MS,
+                 drop_rate=0.0, time_scale=1.0, seed=None):
+        super().__init__(daemon=True)
+        self.table = table
+        self.base_latency_ms = base_latency_ms
+        self.jitter_ms = jitter_ms
+        self.drop_rate = drop_rate
+        self.time_scale = time_scale
+        self.random = random.Random(seed)
+        self.pending = []  # heap of (due perf_counter, seq, note, velocity)
+        self.condition = threading.Condition()
+        self.callbacks = []  # One per open input
+        self.stop_event = threading.Event()
+        self.sent = 0
+        self.echoed = 0
+        self.dropped = 0
+
+    @classmethod
+    def from_calibration(cls, **kwargs):
+        """Simulator using response_table.bin, else a fit of calibration_data.csv."""
+        return cls(load_latency_table(), **kwargs)
+
+    def open_output(self):
+        self.ensure_running()
+        return LoopbackOutput(self)
+
+    def open_input(self, callback=None):
+        self.ensure_running()
+        return LoopbackInput(self, callback)
+
+    def ensure_running(self):
+        if not self.is_alive() and not self.stop_event.is_set():
+            self.start()
+
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify()
+
+    def latency_s(self, note, velocity):
+        latency_ms = self.table.latency(note, velocity) if self.table is not None else 0.0
+        if latency_ms <= 0:
+            latency_ms = self.base_latency_ms
+        if self.jitter_ms:
+            latency_ms = max(0.0, latency_ms + self.random.gauss(0.0, self.jitter_ms))
+        return latency_ms * self.time_scale / 1000
+
+    def strike(self, note, velocity):
+        """Queue the echo of one note_on (called from the sending thread)."""
+        with self.condition:
+            self.sent += 1
+            if self.drop_rate and self.random.random() < self.drop_rate:
+                self.dropped += 1
+                return
+            due = time.perf_counter() + self.latency_s(note, velocity)
+            heapq.heappush(self.pending, (due, self.sent, note, velocity))
+            self.condition.notify()
+
+    def send_raw(self, data):
+        if data[0] & 0xF0 == 0x90 and data[2] > 0:
+            self.strike(data[1], data[2])
+
+    def send(self, message):
+        if message.type == 'note_on' and message.velocity > 0:
+            self.strike(message.note, message.velocity)
+
+    def run(self):
+        pending = self.pending
+        while not self.stop_event.is_set():
+            with self.condition:
+                if not pending:
+                    self.condition.wait()
+                    continue
+                due, _, note, velocity = pending[0]
+                remaining = due - time.perf_counter()
+                if remaining > SPIN_S:
+                    self.condition.wait(remaining - SPIN_S)  # Woken early if a sooner echo is queued
+                    continue
+                heapq.heappop(pending)
+            while time.perf_counter() < due:
+                pass  # Spin the last SPIN_S for an accurate echo time
+            if self.table is not None:
+                velocity = self.table.received(note, velocity) or velocity
+            message = mido.Message('note_on', note=note, velocity=velocity)
+            self.echoed += 1
+            for callback in list(self.callbacks):
+                callback(message)
+
+
+class LoopbackOutput:
+    """Output port writing into a LoopbackPiano. Closing it leaves the piano running."""
+
+    def __init__(self, piano):
+        self.piano = piano
+        self.name = SIMULATED_PORT
+        self.send = piano.send
+        self.send_raw = piano.send_raw  # Picked up by midi_bytes.raw_sender
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LoopbackInput:
+    """Input port fed by a LoopbackPiano; callback(message) runs on the piano's thread."""
+
+    def __init__(self, piano, callback=None):
+        self.piano = piano
+        self.name = SIMULATED_PORT
+        self.callback = callback
+        self.closed = False
+        if callback is not None:
+            piano.callbacks.append(callback)
+
+    def close(self):
+        if not self.closed and self.callback is not None:
+            self.piano.callbacks.remove(self.callback)
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def configure(**settings):
+    """Set LoopbackPiano arguments for the shared simulator (before it is first opened)."""
+    _default_settings.update(settings)
+
+
+def default_piano():
+    global _default_piano
+    if _default_piano is None:
+        _default_piano = LoopbackPiano.from_calibration(**_default_settings)
+    return _default_piano
+
+
+def open_input(name=None, callback=None):
+    """mido.open_input, plus the simulator for SIMULATED_PORT."""
+    if name == SIMULATED_PORT:
+        return default_piano().open_input(callback)
+    return mido.open_input(name, callback=callback)
+
+
+def open_output(name=None):
+    """mido.open_output, plus the simulator for SIMULATED_PORT."""
+    if name == SIMULATED_PORT:
+        return default_piano().open_output()
+    return mido.open_output(name)
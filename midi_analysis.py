@@ -0,0 +1,342 @@
+"""Single-pass Standard MIDI File scanning and per-channel indexing.
+
+Works on the raw file bytes so the MIDI Channel Editor (and the batch tools)
+can list channels without building mido message objects.
+"""
+import struct
+from array import array
+from bisect import bisect_right
+
+# General MIDI instrument names (0-127)
+GM_INSTRUMENTS = [
+    "Acoustic Grand Piano", "Bright Acoustic Piano", "Electric Grand Piano", "Honky-tonk Piano",
+    "Electric Piano 1", "Electric Piano 2", "Harpsichord", "Clavi", "Celesta", "Glockenspiel",
+    "Music Box", "Vibraphone", "Marimba", "Xylophone", "Tubular Bells", "Dulcimer",
+    "Drawbar Organ", "Percussive Organ", "Rock Organ", "Church Organ", "Reed Organ",
+    "Accordion", "Harmonica", "Tango Accordion", "Acoustic Guitar (nylon)", "Acoustic Guitar (steel)",
+    "Electric Guitar (jazz)", "Electric Guitar (clean)", "Electric Guitar (muted)", "Overdriven Guitar",
+    "Distortion Guitar", "Guitar harmonics", "Acoustic Bass", "Electric Bass (finger)",
+    "Electric Bass (pick)", "Fretless Bass", "Slap Bass 1", "Slap Bass 2", "Synth Bass 1",
+    "Synth Bass 2", "Violin", "Viola", "Cello", "Contrabass", "Tremolo Strings", "Pizzicato Strings",
+    "Orchestral Harp", "Timpani", "String Ensemble 1", "String Ensemble 2", "SynthStrings 1",
+    "SynthStrings 2", "Choir Aahs", "Voice Oohs", "Synth Voice", "Orchestra Hit", "Trumpet",
+    "Trombone", "Tuba", "Muted Trumpet", "French Horn", "Brass Section", "SynthBrass 1",
+    "SynthBrass 2", "Soprano Sax", "Alto Sax", "Tenor Sax", "Baritone Sax", "Oboe",
+    "English Horn", "Bassoon", "Clarinet", "Piccolo", "Flute", "Recorder", "Pan Flute",
+    "Blown Bottle", "Shakuhachi", "Whistle", "Ocarina", "Lead 1 (square)", "Lead 2 (sawtooth)",
+    "Lead 3 (calliope)", "Lead 4 (chiff)", "Lead 5 (charang)", "Lead 6 (voice)", "Lead 7 (fifths)",
+    "Lead 8 (bass + lead)", "Pad 1 (new age)", "Pad 2 (warm)", "Pad 3 (polysynth)", "Pad 4 (choir)",
+    "Pad 5 (bowed)", "Pad 6 (metallic)", "Pad 7 (halo)", "Pad 8 (sweep)", "FX 1 (rain)",
+    "FX 2 (soundtrack)", "FX 3 (crystal)", "FX 4 (atmosphere)", "FX 5 (brightness)",
+    "FX 6 (goblins)", "FX 7 (echoes)", "FX 8 (sci-fi)", "Sitar", "Banjo", "Shamisen",
+    "Koto", "Kalimba", "Bag pipe", "Fiddle", "Shanai", "Tinkle Bell", "Agogo", "Steel Drums",
+    "Woodblock", "Taiko Drum", "Melodic Tom", "Synth Drum", "Reverse Cymbal", "Guitar Fret Noise",
+    "Breath Noise", "Seashore", "Bird Tweet", "Telephone Ring", "Helicopter", "Applause",
+    "Gunshot"
+]
+
+CHUNK_HEADER = struct.Struct(">4sI")
+META = 0xFF
+SYSEX = 0xF0
+SYSEX_ESCAPE = 0xF7
+TRACK_NAME = 0x03
+SET_TEMPO = 0x51
+DEFAULT_TEMPO = 500000  # Microseconds per beat (120 bpm) until the first set_tempo
+PROGRESS_BYTES = 256 * 1024  # Scanners call progress() about this often
+
+
+def read_varlen(data, pos):
+    """Decode a variable-length quantity. Returns (value, new_pos)."""
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def channel_data_length(status):
+    """Number of data bytes after a channel voice status byte."""
+    return 1 if status & 0xF0 in (0xC0, 0xD0) else 2
+
+
+def iter_chunks(data):
+    """Yield (chunk_type, offset, data_start, data_end) for every chunk in an SMF."""
+    pos = 0
+    while pos + CHUNK_HEADER.size <= len(data):
+        chunk_type, length = CHUNK_HEADER.unpack_from(data, pos)
+        start = pos + CHUNK_HEADER.size
+        end = min(start + length, len(data))
+        yield chunk_type, pos, start, end
+        pos = end
+
+
+def iter_track_events(data, start, end, progress=None):
+    """Yield (offset, delta, status, data_start, data_end) for each event in a track chunk.
+
+    offset is where the event's delta time begins. Running status is resolved,
+    so status is always the real status byte. For meta events data_start
+    points at the meta type byte. progress(fraction of the file), if given,
+    is called every PROGRESS_BYTES and may raise to abandon the scan.
+    """
+    pos = start
+    running_status = None
+    next_report = start if progress is not None else end  # Report at the start of each track too
+    while pos < end:
+        if pos >= next_report:
+            progress(pos / len(data))
+            next_report = pos + PROGRESS_BYTES
+        offset = pos
+        delta, pos = read_varlen(data, pos)
+        status = data[pos]
+        if status & 0x80:
+            pos += 1
+        elif running_status is None:
+            raise ValueError(f"Running status without a previous status byte at offset {pos}")
+        else:
+            status = running_status
+
+        if status == META:
+            data_start = pos
+            length, pos = read_varlen(data, pos + 1)
+            pos += length
+        elif status in (SYSEX, SYSEX_ESCAPE):
+            length, data_start = read_varlen(data, pos)
+            pos = data_start + length
+        else:
+            data_start = pos
+            pos += channel_data_length(status)
+            running_status = status
+        yield offset, delta, status, data_start, pos
+
+
+class ChannelStats:
+    """What one MIDI channel contains."""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.messages = 0
+        self.notes = 0
+        self.low_note = None
+        self.high_note = None
+        self.programs = []  # In order of appearance, without repeats
+        self.tracks = set()
+        self.first_offset = None  # File offset of the channel's first event
+
+    def add_note(self, note):
+        self.notes += 1
+        if self.low_note is None or note < self.low_note:
+            self.low_note = note
+        if self.high_note is None or note > self.high_note:
+            self.high_note = note
+
+
+class MidiAnalysis:
+    """Per-channel index of a MIDI file built in one pass over its bytes.
+
+    names follows the same rules the editor always used: a program change
+    names the channel after its GM instrument, otherwise the name of the
+    track the channel appears in; later tracks win. Offsets refer to the
+    file as it was analysed.
+    """
+
+    def __init__(self):
+        self.channels = {}  # channel -> ChannelStats
+        self.names = {}  # channel -> display name
+        self.track_names = []  # One entry (or None) per track
+        self.track_offsets = []  # (chunk offset, chunk end) per track
+        self.ticks_per_beat = None
+        self.file_type = None
+
+    def remove_channels(self, channels):
+        """Drop deleted channels from the index without rescanning."""
+        for channel in channels:
+            self.channels.pop(channel, None)
+            self.names.pop(channel, None)
+
+    def channel_names(self):
+        """{channel: display name} for channels that have at least one event."""
+        return {channel: self.names.get(channel, f"Channel {channel}") for channel in sorted(self.channels)}
+
+    def to_dict(self):
+        """Plain JSON-able form, used by the parsed-file cache."""
+        return {
+            "channels": [dict(vars(stats), tracks=sorted(stats.tracks)) for stats in self.channels.values()],
+            "names": {str(channel): name for channel, name in self.names.items()},
+            "track_names": self.track_names,
+            "track_offsets": self.track_offsets,
+            "ticks_per_beat": self.ticks_per_beat,
+            "file_type": self.file_type,
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        analysis = cls()
+        for fields in values["channels"]:
+            stats = ChannelStats(fields["channel"])
+            stats.__dict__.update(fields, tracks=set(fields["tracks"]))
+            analysis.channels[stats.channel] = stats
+        analysis.names = {int(channel): name for channel, name in values["names"].items()}
+        analysis.track_names = values["track_names"]
+        analysis.track_offsets = [tuple(offsets) for offsets in values["track_offsets"]]
+        analysis.ticks_per_beat = values["ticks_per_beat"]
+        analysis.file_type = values["file_type"]
+        return analysis
+
+
+def analyze_bytes(data, progress=None):
+    """Build a MidiAnalysis from the raw bytes of a Standard MIDI File.
+
+    progress is passed on to iter_track_events.
+    """
+    if data[:4] != b"MThd":
+        raise ValueError("Not a Standard MIDI File (no MThd header)")
+    analysis = MidiAnalysis()
+    for chunk_type, offset, start, end in iter_chunks(data):
+        if chunk_type == b"MThd":
+            analysis.file_type, _, analysis.ticks_per_beat = struct.unpack_from(">HHH", data, start)
+            continue
+        if chunk_type != b"MTrk":
+            continue
+
+        track_index = len(analysis.track_offsets)
+        analysis.track_offsets.append((offset, end))
+        track_name = None
+        channel_programs = {}
+        for event_offset, _, status, data_start, data_end in iter_track_events(data, start, end, progress):
+            if status == META:
+                if data[data_start] == TRACK_NAME:
+                    length, text_start = read_varlen(data, data_start + 1)
+                    track_name = bytes(data[text_start:text_start + length]).decode("latin1")
+                continue
+            if status >= SYSEX:
+                continue
+
+            channel = status & 0x0F
+            kind = status & 0xF0
+            stats = analysis.channels.get(channel)
+            if stats is None:
+                stats = analysis.channels[channel] = ChannelStats(channel)
+                stats.first_offset = event_offset
+            stats.messages += 1
+            stats.tracks.add(track_index)
+            if kind == 0xC0:
+                program = data[data_start]
+                if program not in stats.programs:
+                    stats.programs.append(program)
+                if 0 <= program < len(GM_INSTRUMENTS):
+                    channel_programs[channel] = GM_INSTRUMENTS[program]
+            else:
+                if kind == 0x90 and data[data_start + 1] > 0:
+                    stats.add_note(data[data_start])
+                if channel not in channel_programs and track_name:
+                    channel_programs[channel] = track_name
+
+        analysis.track_names.append(track_name)
+        for channel, name in channel_programs.items():
+            analysis.names[channel] = f"Ch {channel}: {name}"
+    return analysis
+
+
+def analyze_file(path):
+    with open(path, "rb") as f:
+        return analyze_bytes(f.read())
+
+
+class NoteArrays:
+    """All notes of a file as parallel columns (one entry per note).
+
+    start/end are absolute ticks; notes left sounding at the end of a track
+    end there. tempo_map is a sorted [(tick, microseconds per beat)] merged
+    from all tracks.
+    """
+
+    def __init__(self, ticks_per_beat=480, tempo_map=None):
+        self.ticks_per_beat = ticks_per_beat
+        self.tempo_map = tempo_map or [(0, DEFAULT_TEMPO)]
+        self.start = array("I")
+        self.end = array("I")
+        self.pitch = array("B")
+        self.velocity = array("B")
+        self.channel = array("B")
+        self.track = array("H")
+
+    def __len__(self):
+        return len(self.start)
+
+    def append(self, start, end, pitch, velocity, channel, track):
+        self.start.append(start)
+        self.end.append(end)
+        self.pitch.append(pitch)
+        self.velocity.append(velocity)
+        self.channel.append(channel)
+        self.track.append(track)
+
+    def seconds(self, ticks):
+        """Convert a list of absolute ticks to seconds using the tempo map."""
+        if self.ticks_per_beat & 0x8000:
+            raise ValueError("SMPTE time division is not supported")
+        # Seconds elapsed at the start of each tempo segment
+        segment_ticks = [tick for tick, _ in self.tempo_map]
+        segment_seconds = [0.0]
+        for (tick, tempo), (next_tick, _) in zip(self.tempo_map, self.tempo_map[1:]):
+            segment_seconds.append(segment_seconds[-1] + (next_tick - tick) * tempo / 1e6 / self.ticks_per_beat)
+        result = []
+        for tick in ticks:
+            i = bisect_right(segment_ticks, tick) - 1
+            seg_tick, tempo = self.tempo_map[max(i, 0)]
+            result.append(segment_seconds[max(i, 0)] + (tick - seg_tick) * tempo / 1e6 / self.ticks_per_beat)
+        return result
+
+
+def extract_notes(data, progress=None):
+    """Pair note_on/note_off events of an SMF into NoteArrays, in one pass per track.
+
+    Overlapping notes on the same channel and pitch are closed first-in,
+    first-out, matching how most sequencers write them. progress is passed
+    on to iter_track_events.
+    """
+    if data[:4] != b"MThd":
+        raise ValueError("Not a Standard MIDI File (no MThd header)")
+    ticks_per_beat = 480
+    tempos = {}
+    raw = []  # (start, end, pitch, velocity, channel, track) before sorting
+    track_index = 0
+    for chunk_type, _, start, end in iter_chunks(data):
+        if chunk_type == b"MThd":
+            ticks_per_beat = struct.unpack_from(">H", data, start + 4)[0]
+            continue
+        if chunk_type != b"MTrk":
+            continue
+        tick = 0
+        sounding = {}  # (channel, pitch) -> [(start, velocity), ...]
+        for _, delta, status, data_start, _ in iter_track_events(data, start, end, progress):
+            tick += delta
+            kind = status & 0xF0
+            if status == META:
+                if data[data_start] == SET_TEMPO:
+                    tempo_start = read_varlen(data, data_start + 1)[1]
+                    tempos[tick] = int.from_bytes(data[tempo_start:tempo_start + 3], "big")
+                continue
+            if kind not in (0x80, 0x90) or status >= SYSEX:
+                continue
+            key = (status & 0x0F, data[data_start])
+            velocity = data[data_start + 1]
+            if kind == 0x90 and velocity > 0:
+                sounding.setdefault(key, []).append((tick, velocity))
+            elif sounding.get(key):
+                note_start, note_velocity = sounding[key].pop(0)
+                raw.append((note_start, tick, key[1], note_velocity, key[0], track_index))
+        for (channel, pitch), notes in sounding.items():
+            for note_start, note_velocity in notes:
+                raw.append((note_start, tick, pitch, note_velocity, channel, track_index))
+        track_index += 1
+
+    tempo_map = sorted(tempos.items())
+    if not tempo_map or tempo_map[0][0] != 0:
+        tempo_map.insert(0, (0, DEFAULT_TEMPO))
+    notes = NoteArrays(ticks_per_beat, tempo_map)
+    for note in sorted(raw, key=lambda n: (n[0], n[2])):
+        notes.append(*note)
+    return notes
@@ -0,0 +1,89 @@
+"""Pre-encoded MIDI messages and a raw send path.
+
+mido.Message objects are validated and encoded on every send. The hot paths
+(key presses, sweeps, playback) look up ready-made bytes instead and hand
+them straight to the backend.
+"""
+import threading
+
+import mido
+
+FIRST_KEY = 21  # A0
+LAST_KEY = 108  # C8
+ALL_NOTES_OFF = 123
+
+_raw_send_lock = threading.RLock()  # For rtmidi ports without a _send_lock of their own
+_note_tables = {}  # channel -> (note_on, note_off), each indexed by (note - FIRST_KEY) * 128 + velocity
+
+
+def note_tables(channel=0):
+    """Encoded note_on and note_off messages for every key and velocity on one channel.
+
+    Built on first use per channel (88 x 128 messages each) and shared after that.
+    """
+    tables = _note_tables.get(channel)
+    if tables is None:
+        keys = range(FIRST_KEY, LAST_KEY + 1)
+        note_on = tuple(bytes((0x90 | channel, note, velocity)) for note in keys for velocity in range(128))
+        note_off = tuple(bytes((0x80 | channel, note, velocity)) for note in keys for velocity in range(128))
+        tables = _note_tables[channel] = (note_on, note_off)
+    return tables
+
+
+def note_on_bytes(note, velocity, channel=0):
+    if FIRST_KEY <= note <= LAST_KEY:
+        return note_tables(channel)[0][(note - FIRST_KEY) * 128 + velocity]
+    return bytes((0x90 | channel, note, velocity))  # Outside the piano, not worth a table
+
+
+def note_off_bytes(note, velocity=0, channel=0):
+    if FIRST_KEY <= note <= LAST_KEY:
+        return note_tables(channel)[1][(note - FIRST_KEY) * 128 + velocity]
+    return bytes((0x80 | channel, note, velocity))
+
+
+def raw_sender(port):
+    """Return send(data) that writes already-encoded bytes to port.
+
+    Ports with a send_raw method use it; mido's rtmidi ports are written
+    through the backend directly, under the port's own send lock since the
+    sweep, playback and Tk threads may share one port; sending to one after
+    it is closed raises ValueError like mido's own ports. Anything else gets
+    a decoded Message.
+    """
+    send_raw = getattr(port, "send_raw", None)
+    if send_raw is not None:
+        return send_raw
+    rt = getattr(port, "_rt", None)
+    if rt is not None and hasattr(rt, "send_message"):
+        lock = getattr(port, "_send_lock", None) or _raw_send_lock
+        send_message = rt.send_message
+
+        def send(data):
+            with lock:
+                if port.closed:
+                    # mido's rtmidi Output.send does not check this; its handle is already gone
+                    raise ValueError('send() called on closed port')
+                send_message(data)
+        return send
+    return lambda data: port.send(mido.Message.from_bytes(data))
+
+
+def notes_off_messages(channels=(0,), all_keys=False):
+    """CC 123 for each channel, plus a note_off for all 88 keys when all_keys is set.
+
+    The note_offs are for instruments that ignore All Notes Off.
+    """
+    messages = [bytes((0xB0 | channel, ALL_NOTES_OFF, 0)) for channel in channels]
+    if all_keys:
+        for channel in channels:
+            note_off = note_tables(channel)[1]
+            messages.extend(note_off[i * 128] for i in range(LAST_KEY - FIRST_KEY + 1))
+    return messages
+
+
+def send_all_notes_off(port, channels=(0,), all_keys=False):
+    """Silence port with one back-to-back burst of pre-encoded messages."""
+    send = raw_sender(port)
+    for data in notes_off_messages(channels, all_keys):
+        send(data)
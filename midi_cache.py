@@ -0,0 +1,175 @@
+"""On-disk cache of analysed MIDI files.
+
+Entries are keyed by a hash of the file contents, so an edited file simply
+gets a new entry and the old one ages out. A small path index remembers
+(size, mtime) -> hash so unchanged files are not even re-read.
+
+Streaming-mode loads ask for the analysis only: no note columns are built,
+and an entry written that way holds none, so memory stays independent of
+the file's size. A later load that wants notes parses the file again.
+"""
+import hashlib
+import json
+import os
+import struct
+import sys
+
+from midi_analysis import MidiAnalysis, NoteArrays, analyze_bytes, extract_notes
+from midi_stream import MappedFile
+
+CACHE_DIR = "midi_cache"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+CACHE_MAGIC = b"PPMIDC\x00\x01"
+CACHE_HEADER = struct.Struct("<8sIQ")  # magic, JSON length, note count
+INDEX_FILE = "index.json"
+NOTE_COLUMNS = ["start", "end", "pitch", "velocity", "channel", "track"]
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def encode_entry(analysis, notes):
+    """Entry bytes; notes may be None for an analysis-only entry."""
+    meta = {"analysis": analysis.to_dict(), "has_notes": notes is not None}
+    if notes is not None:
+        meta["ticks_per_beat"] = notes.ticks_per_beat
+        meta["tempo_map"] = notes.tempo_map
+    meta = json.dumps(meta).encode()
+    parts = [CACHE_HEADER.pack(CACHE_MAGIC, len(meta), len(notes) if notes is not None else 0), meta]
+    if notes is not None:
+        parts.extend(getattr(notes, column).tobytes() for column in NOTE_COLUMNS)
+    return b"".join(parts)
+
+
+def read_entry_file(f, with_notes=True):
+    """Decode an entry from an open file; the note columns are only read when with_notes is set.
+
+    Returns (MidiAnalysis, NoteArrays or None), or None when notes are wanted
+    but the entry has none.
+    """
+    magic, meta_length, count = CACHE_HEADER.unpack(f.read(CACHE_HEADER.size))
+    if magic != CACHE_MAGIC:
+        raise ValueError("Not a MIDI cache entry")
+    meta = json.loads(f.read(meta_length))
+    analysis = MidiAnalysis.from_dict(meta["analysis"])
+    if not with_notes:
+        return analysis, None
+    if not meta.get("has_notes", True):
+        return None
+    notes = NoteArrays(meta["ticks_per_beat"], [tuple(entry) for entry in meta["tempo_map"]])
+    for column in NOTE_COLUMNS:
+        values = getattr(notes, column)
+        values.fromfile(f, count)
+    return analysis, notes
+
+
+class MidiCache:
+    """Content-addressed cache of (MidiAnalysis, NoteArrays) with size-bounded LRU eviction.
+
+    Recency is the entry file's mtime, bumped on every hit, so the LRU order
+    survives restarts without a separate journal.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        try:
+            with open(self.index_path, "r") as f:
+                self.index = json.load(f)  # abs path -> [size, mtime_ns, hash]
+        except (FileNotFoundError, ValueError):
+            self.index = {}
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key + ".bin")
+
+    def load(self, path, progress=None, with_notes=True):
+        """Return (MidiAnalysis, NoteArrays) for a MIDI file, from the cache when possible.
+
+        With with_notes=False the NoteArrays is None and never built.
+        progress(fraction) is only called when the file has to be parsed.
+        """
+        path = os.path.abspath(path)
+        info = os.stat(path)
+        known = self.index.get(path)
+        if known and known[0] == info.st_size and known[1] == info.st_mtime_ns:
+            result = self.read_entry(known[2], with_notes)
+            if result is not None:
+                return result
+
+        # New or changed file: hash the contents, an entry may still exist under that hash
+        with MappedFile(path) as data:
+            key = content_hash(data)
+            result = self.read_entry(key, with_notes)
+            if result is None:
+                self.misses += 1
+                if with_notes:
+                    result = (analyze_bytes(data, progress and (lambda f: progress(f / 2))),
+                              extract_notes(data, progress and (lambda f: progress(0.5 + f / 2))))
+                else:
+                    result = (analyze_bytes(data, progress), None)
+                self.write_entry(key, *result)
+        self.index[path] = [info.st_size, info.st_mtime_ns, key]
+        self.save_index()
+        return result
+
+    def read_entry(self, key, with_notes=True):
+        if sys.byteorder != "little":
+            return None  # Entries hold little-endian columns
+        entry = self.entry_path(key)
+        try:
+            with open(entry, "rb") as f:
+                result = read_entry_file(f, with_notes)
+            if result is None:
+                return None
+            os.utime(entry)  # Mark as recently used
+        except (OSError, ValueError, KeyError, EOFError, struct.error):
+            return None
+        self.hits += 1
+        return result
+
+    def write_entry(self, key, analysis, notes):
+        if sys.byteorder != "little":
+            return
+        entry = self.entry_path(key)
+        with open(entry + ".tmp", "wb") as f:
+            f.write(encode_entry(analysis, notes))
+        os.replace(entry + ".tmp", entry)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".bin"):
+                info = os.stat(os.path.join(self.directory, name))
+                entries.append((info.st_mtime_ns, info.st_size, name))
+                total += info.st_size
+        entries.sort()
+        removed = set()
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            removed.add(name[:-4])
+            total -= size
+        if removed:
+            self.index = {path: known for path, known in self.index.items() if known[2] not in removed}
+            self.save_index()
+
+    def save_index(self):
+        with open(self.index_path + ".tmp", "w") as f:
+            json.dump(self.index, f)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".bin"):
+                os.remove(os.path.join(self.directory, name))
+        self.index = {}
+        self.save_index()
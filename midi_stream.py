@@ -0,0 +1,117 @@
+"""Byte-level streaming channel filter for Standard MIDI Files.
+
+The source file is memory-mapped and scanned event by event; kept events are
+copied straight to the output in small blocks, so memory use does not grow
+with file size and no mido message objects are created.
+"""
+import mmap
+import os
+import struct
+
+from midi_analysis import CHUNK_HEADER, SYSEX, iter_chunks, iter_track_events, read_varlen
+
+FLUSH_BYTES = 64 * 1024  # Write kept events out in blocks of about this size
+
+
+def write_varlen(value):
+    """Encode a variable-length quantity."""
+    out = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        out.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(out)
+
+
+class MappedFile:
+    """Read-only memory map of a file, usable as a context manager."""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"{path} is empty")
+
+    def __enter__(self):
+        return self.map
+
+    def __exit__(self, *exc):
+        self.map.close()
+        self.file.close()
+
+
+def filter_track(data, start, end, drop_channels, out, progress=None):
+    """Copy one track's events to out, leaving out channel events in drop_channels.
+
+    Delta times of removed events are added to the next kept event so the
+    timing of everything else is unchanged. Running status is re-derived
+    for the output. Returns (kept, dropped, bytes written).
+    """
+    buffer = bytearray()
+    written = 0
+    kept = dropped = 0
+    carry = 0
+    out_status = None  # Running status of the output stream
+    for offset, delta, status, data_start, data_end in iter_track_events(data, start, end, progress):
+        if status < SYSEX and (status & 0x0F) in drop_channels:
+            carry += delta
+            dropped += 1
+            continue
+
+        buffer += write_varlen(delta + carry)
+        carry = 0
+        if status < SYSEX:
+            if status != out_status:
+                buffer.append(status)
+                out_status = status
+            buffer += data[data_start:data_end]
+        else:
+            # Meta and sysex events are copied whole (status byte onwards) and cancel running status
+            event_start = read_varlen(data, offset)[1]
+            buffer += data[event_start:data_end]
+            out_status = None
+        kept += 1
+
+        if len(buffer) >= FLUSH_BYTES:
+            out.write(buffer)
+            written += len(buffer)
+            buffer.clear()
+
+    out.write(buffer)
+    written += len(buffer)
+    return kept, dropped, written
+
+
+def filter_channels(src_path, dst_path, drop_channels, progress=None):
+    """Write a copy of src_path without any events on drop_channels.
+
+    Track chunk lengths are patched in after each track is written, so the
+    output is produced in one forward pass. dst_path may be the source file;
+    it is only replaced once the copy is complete, so an exception from
+    progress leaves it untouched. Returns (kept, dropped) event counts.
+    """
+    drop_channels = set(drop_channels)
+    kept_total = dropped_total = 0
+    tmp_path = dst_path + ".tmp"
+    try:
+        with MappedFile(src_path) as data, open(tmp_path, "wb") as out:
+            for chunk_type, offset, start, end in iter_chunks(data):
+                if chunk_type != b"MTrk":
+                    out.write(data[offset:end])  # Header and unknown chunks are copied unchanged
+                    continue
+                header_pos = out.tell()
+                out.write(CHUNK_HEADER.pack(b"MTrk", 0))
+                kept, dropped, length = filter_track(data, start, end, drop_channels, out, progress)
+                out.seek(header_pos + 4)
+                out.write(struct.pack(">I", length))
+                out.seek(0, 2)
+                kept_total += kept
+                dropped_total += dropped
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, dst_path)
+    return kept_total, dropped_total
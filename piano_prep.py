@@ -0,0 +1,200 @@
+"""Make a MIDI file playable on the player piano.
+
+- notes outside A0-C8 are moved by octaves into range
+- overlapping note_ons on the same key are merged into one note
+- re-strikes that come sooner after a release than the key can recover are dropped
+- at most max_polyphony solenoids are held at once; the longest-held note is
+  released early to make room for a new one (a note cut off at its own start is dropped)
+- zero-length notes are lengthened to one tick so their note_off follows the note_on
+
+Each step is a single linear pass over the note columns from
+midi_analysis.extract_notes; everything that is not a note is copied through.
+
+    python piano_prep.py song.mid song_piano.mid --max-polyphony 10
+"""
+import argparse
+import heapq
+import os
+import sys
+from collections import deque
+
+from midi_analysis import (CHUNK_HEADER, META, SYSEX, NoteArrays, extract_notes, iter_chunks,
+                           iter_track_events, read_varlen)
+from midi_stream import MappedFile, write_varlen
+
+FIRST_KEY = 21  # A0
+LAST_KEY = 108  # C8
+DEFAULT_MAX_POLYPHONY = 10  # Solenoids the power supply can hold at once
+DEFAULT_MIN_RESTRIKE_MS = 50  # Time a key needs after release before it can strike again
+END_OF_TRACK = 0x2F
+
+
+def fold_pitch(pitch):
+    """Move a note by whole octaves into the piano's range."""
+    while pitch < FIRST_KEY:
+        pitch += 12
+    while pitch > LAST_KEY:
+        pitch -= 12
+    return pitch
+
+
+def prepare_notes(notes, max_polyphony=DEFAULT_MAX_POLYPHONY, min_restrike_ms=DEFAULT_MIN_RESTRIKE_MS):
+    """Return (prepared NoteArrays, stats dict).
+
+    min_restrike_ms is either one value for every key or a sequence of 88
+    values, A0 first. max_polyphony of 0 or None disables the cap.
+    """
+    if isinstance(min_restrike_ms, (int, float)):
+        restrike_s = [min_restrike_ms / 1000] * (LAST_KEY - FIRST_KEY + 1)
+    else:
+        restrike_s = [ms / 1000 for ms in min_restrike_ms]
+    stats = {"notes": len(notes), "folded": 0, "merged": 0, "restrikes_dropped": 0, "truncated": 0,
+             "cut_to_nothing": 0, "lengthened": 0}
+
+    pitch = [fold_pitch(p) for p in notes.pitch]
+    stats["folded"] = sum(1 for before, after in zip(notes.pitch, pitch) if before != after)
+    start_s = notes.seconds(notes.start)
+    end_s = notes.seconds(notes.end)
+    order = sorted(range(len(notes)), key=lambda i: (notes.start[i], pitch[i]))
+
+    # Merge duplicates and drop early re-strikes, key by key
+    kept = []  # [start, end, end_s, pitch, velocity, channel, track]
+    last_on_key = {}  # pitch -> index in kept of the key's latest note
+    for i in order:
+        p = pitch[i]
+        j = last_on_key.get(p)
+        if j is not None:
+            previous = kept[j]
+            if notes.start[i] < previous[1]:
+                # Key is still down: extend the sounding note instead of striking again
+                if notes.end[i] > previous[1]:
+                    previous[1] = notes.end[i]
+                    previous[2] = end_s[i]
+                previous[4] = max(previous[4], notes.velocity[i])
+                stats["merged"] += 1
+                continue
+            if start_s[i] - previous[2] < restrike_s[p - FIRST_KEY]:
+                stats["restrikes_dropped"] += 1
+                continue
+        last_on_key[p] = len(kept)
+        kept.append([notes.start[i], notes.end[i], end_s[i], p, notes.velocity[i], notes.channel[i], notes.track[i]])
+
+    # Cap simultaneous solenoids; kept is in start order
+    if max_polyphony:
+        ending = []  # heap of (end, index) for notes that may still be sounding
+        held = deque()  # Indexes in start order, oldest first
+        sounding = set()
+        cut = set()  # Truncated all the way to their own start
+        for k, note in enumerate(kept):
+            while ending and ending[0][0] <= note[0]:
+                sounding.discard(heapq.heappop(ending)[1])
+            while len(sounding) >= max_polyphony:
+                oldest = held.popleft()
+                if oldest in sounding:
+                    kept[oldest][1] = note[0]
+                    sounding.discard(oldest)
+                    stats["truncated"] += 1
+                    if note[0] <= kept[oldest][0]:
+                        cut.add(oldest)
+            heapq.heappush(ending, (note[1], k))
+            held.append(k)
+            sounding.add(k)
+        stats["cut_to_nothing"] = len(cut)
+        kept = [note for k, note in enumerate(kept) if k not in cut]  # Never got a solenoid
+
+    prepared = NoteArrays(notes.ticks_per_beat, notes.tempo_map)
+    for start, end, _, p, velocity, channel, track in kept:
+        if end <= start:
+            # Zero-length in the source (drum hits, generated files); at one tick its
+            # note_off is still written after the note_on
+            end = start + 1
+            stats["lengthened"] += 1
+        prepared.append(start, end, p, velocity, channel, track)
+    stats["notes_out"] = len(prepared)
+    return prepared, stats
+
+
+def write_prepared(data, notes, dst_path, progress=None):
+    """Write the source file's non-note events plus the prepared notes to dst_path.
+
+    Each note goes back into the track it came from. At equal ticks note_offs
+    come first and note_ons last, so a release never cuts off the next strike.
+    """
+    track_notes = {}
+    for i in range(len(notes)):
+        track_notes.setdefault(notes.track[i], []).append(i)
+
+    with open(dst_path, "wb") as out:
+        track_index = 0
+        for chunk_type, offset, start, end in iter_chunks(data):
+            if chunk_type != b"MTrk":
+                out.write(data[offset:end])
+                continue
+            events = []  # (tick, priority, seq, bytes)
+            tick = 0
+            for event_offset, delta, status, data_start, data_end in iter_track_events(data, start, end, progress):
+                tick += delta
+                if status < SYSEX:
+                    if status & 0xF0 in (0x80, 0x90):
+                        continue
+                    event = bytes([status]) + bytes(data[data_start:data_end])
+                elif status == META and data[data_start] == END_OF_TRACK:
+                    continue
+                else:
+                    event = bytes(data[read_varlen(data, event_offset)[1]:data_end])
+                events.append((tick, 1, len(events), event))
+            for i in track_notes.get(track_index, ()):
+                channel = notes.channel[i]
+                events.append((notes.start[i], 2, len(events), bytes([0x90 | channel, notes.pitch[i], notes.velocity[i]])))
+                events.append((notes.end[i], 0, len(events), bytes([0x80 | channel, notes.pitch[i], 0])))
+            events.sort()
+
+            body = bytearray()
+            previous = 0
+            for event_tick, _, _, event in events:
+                body += write_varlen(event_tick - previous)
+                body += event
+                previous = event_tick
+            body += write_varlen(max(tick - previous, 0)) + bytes([META, END_OF_TRACK, 0])
+            out.write(CHUNK_HEADER.pack(b"MTrk", len(body)))
+            out.write(body)
+            track_index += 1
+
+
+def prepare_file(src_path, dst_path, max_polyphony=DEFAULT_MAX_POLYPHONY, min_restrike_ms=DEFAULT_MIN_RESTRIKE_MS,
+                 progress=None):
+    """Run the whole preparation stage on one file. Returns the stats dict.
+
+    progress(fraction) is called while reading and writing; if it raises,
+    dst_path is left as it was.
+    """
+    tmp_path = dst_path + ".tmp"
+    try:
+        with MappedFile(src_path) as data:
+            notes, stats = prepare_notes(extract_notes(data, progress and (lambda f: progress(f / 2))),
+                                         max_polyphony, min_restrike_ms)
+            write_prepared(data, notes, tmp_path, progress and (lambda f: progress(0.5 + f / 2)))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, dst_path)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fold, merge and thin out notes so the player piano can play them")
+    parser.add_argument("src", help="Input MIDI file")
+    parser.add_argument("dst", help="Output MIDI file (may be the same as the input)")
+    parser.add_argument("--max-polyphony", type=int, default=DEFAULT_MAX_POLYPHONY,
+                        help=f"Most keys held at once, 0 for no limit (default: {DEFAULT_MAX_POLYPHONY})")
+    parser.add_argument("--min-restrike-ms", type=float, default=DEFAULT_MIN_RESTRIKE_MS,
+                        help=f"Shortest release-to-strike gap on one key (default: {DEFAULT_MIN_RESTRIKE_MS})")
+    args = parser.parse_args(argv)
+    stats = prepare_file(args.src, args.dst, args.max_polyphony, args.min_restrike_ms)
+    print(", ".join(f"{name}: {value}" for name, value in stats.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""Scrollable, zoomable piano-roll preview of a NoteArrays.
+
+Only notes overlapping the visible time range are looked at: starts are
+sorted, so the range is found with bisect, and the few very long notes are
+kept in a separate list that is always checked. When there are more notes in
+view than MAX_NOTE_ITEMS the roll switches to an aggregated view: each pitch
+row is rasterised into cells a few pixels wide and every run of cells with
+the same channel becomes one rectangle. Cells are widened until there are
+at most MAX_NOTE_ITEMS runs, so no more note rectangles than that are drawn.
+"""
+import re
+import tkinter as tk
+from bisect import bisect_left, bisect_right
+from tkinter import ttk
+
+CHANNEL_COLORS = ["#e6194b", "#3cb44b", "#ffe119", "#4363d8", "#f58231", "#911eb4", "#46f0f0", "#f032e6",
+                  "#bcf60c", "#fabebe", "#008080", "#e6beff", "#9a6324", "#fffac8", "#800000", "#aaffc3"]
+DIMMED_COLOR = "#505050"  # Channels not selected while a selection exists
+BACKGROUND = "#1e1e1e"
+KEY_LINE_COLOR = "#2c2c2c"  # Row lines at every C
+MAX_NOTE_ITEMS = 4000  # More visible notes than this are drawn aggregated
+CELL_PX = 2  # Narrowest aggregation cell; doubled until the runs fit in MAX_NOTE_ITEMS
+LONG_NOTE_BEATS = 16  # Notes longer than this are not found by the start-time bisect
+ZOOM_STEP = 1.25
+REDRAW_MS = 16  # Coalesce view changes into one redraw per frame
+RUN = re.compile(rb"([\x01-\x10])\1*")  # A run of cells with the same channel (stored as channel + 1)
+
+
+class PianoRoll(ttk.Frame):
+    """Canvas plus horizontal scrollbar. Mouse wheel scrolls, Ctrl+wheel zooms, dragging pans."""
+
+    def __init__(self, master, height=200):
+        super().__init__(master)
+        self.canvas = tk.Canvas(self, height=height, bg=BACKGROUND, highlightthickness=0)
+        self.canvas.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.xview)
+        self.scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.notes = None
+        self.order = []  # Indexes of normal-length notes, by start
+        self.starts = []  # Their start ticks, for bisect
+        self.long_notes = []  # Indexes of notes longer than LONG_NOTE_BEATS
+        self.long_limit = 0  # Longest normal-length note in ticks
+        self.length = 1  # Last end tick
+        self.low_pitch = 21
+        self.high_pitch = 108
+        self.view_start = 0  # Tick at the left edge
+        self.ticks_per_px = 1.0
+        self.hidden_channels = set()
+        self.selected_channels = set()
+        self.redraw_job = None
+        self.drag_x = None
+        self.aggregate_key = None  # View the cached aggregate was built for
+        self.aggregate = None
+
+        self.canvas.bind("<Configure>", lambda e: self.schedule_redraw())
+        self.canvas.bind("<MouseWheel>", self.on_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self.on_wheel(e, 1))  # X11 wheel
+        self.canvas.bind("<Button-5>", lambda e: self.on_wheel(e, -1))
+        self.canvas.bind("<ButtonPress-1>", self.on_drag_start)
+        self.canvas.bind("<B1-Motion>", self.on_drag)
+
+    def set_notes(self, notes):
+        """Show a new NoteArrays, zoomed out to the whole file."""
+        self.notes = notes
+        self.aggregate_key = None
+        self.hidden_channels = set()
+        self.selected_channels = set()
+        self.order = []
+        self.long_notes = []
+        self.long_limit = 0
+        if notes is not None and len(notes):
+            start, end = notes.start, notes.end
+            ticks_per_beat = notes.ticks_per_beat if not notes.ticks_per_beat & 0x8000 else 480  # SMPTE: any scale
+            long_ticks = LONG_NOTE_BEATS * ticks_per_beat
+            for i in range(len(notes)):
+                duration = end[i] - start[i]
+                if duration > long_ticks:
+                    self.long_notes.append(i)
+                else:
+                    self.order.append(i)
+                    if duration > self.long_limit:
+                        self.long_limit = duration
+            self.order.sort(key=start.__getitem__)  # extract_notes output is already sorted; this is cheap then
+            self.starts = [start[i] for i in self.order]
+            self.length = max(max(end), 1)
+            self.low_pitch = min(notes.pitch)
+            self.high_pitch = max(notes.pitch)
+        else:
+            self.starts = []
+            self.length = 1
+        self.view_start = 0
+        self.ticks_per_px = self.length / max(self.canvas.winfo_width(), 1)
+        self.schedule_redraw()
+
+    def set_hidden(self, channels):
+        self.hidden_channels = set(channels)
+        self.schedule_redraw()
+
+    def set_selected(self, channels):
+        """Draw these channels in colour and the rest dimmed; an empty set shows all in colour."""
+        self.selected_channels = set(channels)
+        self.schedule_redraw()
+
+    # --- Navigation ---
+
+    def xview(self, *args):
+        """Scrollbar callback."""
+        width = self.canvas.winfo_width()
+        span = width * self.ticks_per_px
+        if args[0] == "moveto":
+            self.view_start = float(args[1]) * self.length
+        elif args[0] == "scroll":
+            step = span * 0.9 if args[2] == "pages" else span * 0.1
+            self.view_start += int(args[1]) * step
+        self.clamp_view()
+        self.schedule_redraw()
+
+    def on_wheel(self, event, direction=None):
+        if direction is None:
+            direction = 1 if event.delta > 0 else -1
+        if event.state & 0x0004:  # Ctrl: zoom around the pointer
+            anchor = self.view_start + event.x * self.ticks_per_px
+            self.ticks_per_px *= 1 / ZOOM_STEP if direction > 0 else ZOOM_STEP
+            self.view_start = anchor - event.x * self.ticks_per_px
+        else:
+            self.view_start -= direction * self.canvas.winfo_width() * self.ticks_per_px * 0.1
+        self.clamp_view()
+        self.schedule_redraw()
+
+    def on_drag_start(self, event):
+        self.drag_x = event.x
+
+    def on_drag(self, event):
+        if self.drag_x is not None:
+            self.view_start -= (event.x - self.drag_x) * self.ticks_per_px
+            self.drag_x = event.x
+            self.clamp_view()
+            self.schedule_redraw()
+
+    def clamp_view(self):
+        width = max(self.canvas.winfo_width(), 1)
+        self.ticks_per_px = min(max(self.ticks_per_px, 0.05), self.length / width * 1.05)
+        self.view_start = min(max(self.view_start, 0), max(self.length - width * self.ticks_per_px, 0))
+
+    # --- Drawing ---
+
+    def schedule_redraw(self):
+        if self.redraw_job is None:
+            self.redraw_job = self.after(REDRAW_MS, self.redraw)
+
+    def visible_notes(self, first_tick, last_tick):
+        """Indexes of notes overlapping [first_tick, last_tick]."""
+        end = self.notes.end
+        lo = bisect_left(self.starts, first_tick - self.long_limit)
+        hi = bisect_right(self.starts, last_tick)
+        visible = [i for i in self.order[lo:hi] if end[i] >= first_tick]
+        visible.extend(i for i in self.long_notes
+                       if self.notes.start[i] <= last_tick and end[i] >= first_tick)
+        return visible
+
+    def note_color(self, channel):
+        if self.selected_channels and channel not in self.selected_channels:
+            return DIMMED_COLOR
+        return CHANNEL_COLORS[channel % len(CHANNEL_COLORS)]
+
+    def redraw(self):
+        self.redraw_job = None
+        canvas = self.canvas
+        canvas.delete("all")
+        width = canvas.winfo_width()
+        height = canvas.winfo_height()
+        if self.notes is None or not len(self.notes) or width <= 1:
+            self.scrollbar.set(0, 1)
+            return
+
+        pitches = self.high_pitch - self.low_pitch + 1
+        row_height = height / pitches
+        for pitch in range(self.low_pitch, self.high_pitch + 1):
+            if pitch % 12 == 0:
+                y = (self.high_pitch - pitch + 1) * row_height
+                canvas.create_line(0, y, width, y, fill=KEY_LINE_COLOR)
+
+        first_tick = self.view_start
+        last_tick = self.view_start + width * self.ticks_per_px
+        hidden = self.hidden_channels
+        channel = self.notes.channel
+        visible = [i for i in self.visible_notes(first_tick, last_tick) if channel[i] not in hidden]
+        if len(visible) <= MAX_NOTE_ITEMS:
+            self.draw_notes(visible, row_height)
+        else:
+            self.draw_aggregated(visible, width, row_height)
+
+        self.scrollbar.set(first_tick / self.length, min(last_tick / self.length, 1.0))
+
+    def draw_notes(self, visible, row_height):
+        """One rectangle per note; used when zoomed in far enough."""
+        notes = self.notes
+        create = self.canvas.create_rectangle
+        view_start = self.view_start
+        scale = 1 / self.ticks_per_px
+        for i in visible:
+            x0 = (notes.start[i] - view_start) * scale
+            x1 = max((notes.end[i] - view_start) * scale, x0 + 1)
+            y0 = (self.high_pitch - notes.pitch[i]) * row_height
+            create(x0, y0, x1, y0 + max(row_height - 1, 1), fill=self.note_color(notes.channel[i]), width=0)
+
+    def draw_aggregated(self, visible, width, row_height):
+        """Draw each same-channel run of aggregation cells as one rectangle."""
+        key = (self.view_start, self.ticks_per_px, width, frozenset(self.hidden_channels))
+        if key != self.aggregate_key:  # A selection change only recolours the last raster
+            self.aggregate_key = key
+            self.aggregate = self.rasterise(visible, width)
+        cell_px, rows = self.aggregate
+
+        create = self.canvas.create_rectangle
+        for pitch, row in rows.items():
+            y0 = (self.high_pitch - pitch) * row_height
+            y1 = y0 + max(row_height - 1, 1)
+            for run in RUN.finditer(row):
+                create(run.start() * cell_px, y0, run.end() * cell_px, y1,
+                       fill=self.note_color(run.group(1)[0] - 1), width=0)
+
+    def rasterise(self, visible, width):
+        """(cell_px, {pitch: bytearray of channel + 1 per cell, 0 where empty}) with at most MAX_NOTE_ITEMS runs."""
+        cell_px = CELL_PX
+        cells = width // cell_px + 1
+        last_cell = cells - 1
+        scale = 1 / (self.ticks_per_px * cell_px)
+        view_start = self.view_start
+        start, end, pitch, channel = self.notes.start, self.notes.end, self.notes.pitch, self.notes.channel
+        fills = [bytes((c + 1,)) for c in range(16)]
+        rows = {}
+        for i in visible:
+            row = rows.get(pitch[i])
+            if row is None:
+                row = rows[pitch[i]] = bytearray(cells)
+            c0 = int((start[i] - view_start) * scale)
+            if c0 < 0:
+                c0 = 0
+            c1 = int((end[i] - view_start) * scale)
+            if c1 > last_cell:
+                c1 = last_cell
+            if c1 >= c0:
+                row[c0:c1 + 1] = fills[channel[i]] * (c1 - c0 + 1)  # Later notes paint over
+
+        # Too many runs: merge neighbouring cells pairwise (the right one wins unless empty)
+        while sum(len(RUN.findall(row)) for row in rows.values()) > MAX_NOTE_ITEMS and cell_px < width:
+            cell_px *= 2
+            for p, row in rows.items():
+                if len(row) % 2:
+                    row.append(0)
+                rows[p] = bytearray(right or left for left, right in zip(row[0::2], row[1::2]))
+        return cell_px, rows
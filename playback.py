@@ -0,0 +1,170 @@
+"""Latency-compensated MIDI file playback.
+
+Each note is sent early by its key's measured actuation latency so the
+hammer strikes on the beat.
+
+    python playback.py song.mid
+"""
+import argparse
+import heapq
+import sys
+import threading
+import time
+
+import mido
+
+import loopback
+from calibrate import load_port_settings
+from midi_bytes import raw_sender, send_all_notes_off
+from response_curve import TABLE_FILE, load_latency_table
+from sweep import SPIN_S, wait_until
+
+LEAD_IN_S = 0.05  # Extra time before the first event on top of the largest compensation
+
+
+def build_events(midi_file, table):
+    """Flatten a MidiFile into a heap of (send_time_s, seq, kind, note, encoded message).
+
+    note_on times are moved earlier by table.latency(note, velocity); the
+    matching note_off is moved by the same amount so held length is kept.
+    Latency depends on velocity, so a re-struck key can be compensated more
+    than the note before it: the earlier note_off is then pulled back to the
+    new note_on (and a note_on never overtakes the key's previous one), so
+    on/off order per key is always kept.
+    Meta messages are dropped. Times are shifted so the earliest is LEAD_IN_S.
+    """
+    events = []
+    shifts = {}  # (channel, note) -> compensation of the sounding note
+    last_on = {}  # (channel, note) -> send time of the key's latest note_on
+    last_off = {}  # (channel, note) -> index in events of the key's latest note_off
+    now = 0.0
+    for seq, message in enumerate(midi_file):  # Iteration converts ticks to seconds, tempo included
+        now += message.time
+        if message.is_meta:
+            continue
+        kind = 'other'
+        note = None
+        send_time = now
+        if message.type == 'note_on' and message.velocity > 0:
+            kind = 'on'
+            note = message.note
+            key = (message.channel, note)
+            shift = table.latency(note, message.velocity) / 1000
+            shifts[key] = shift
+            send_time = max(now - shift, last_on.get(key, now - shift))
+            last_on[key] = send_time
+            index = last_off.pop(key, None)
+            if index is not None and events[index][0] > send_time:
+                events[index] = (send_time,) + events[index][1:]  # Lower seq, so still sent first
+        elif message.type == 'note_off' or message.type == 'note_on':
+            kind = 'off'
+            note = message.note
+            key = (message.channel, note)
+            send_time = max(now - shifts.pop(key, 0.0), last_on.get(key, 0.0))
+            last_off[key] = len(events)
+        events.append((send_time, seq, kind, note, bytes(message.bytes())))
+
+    if events:
+        offset = LEAD_IN_S - min(event[0] for event in events)
+        events = [(send_time + offset, seq, kind, note, message)
+                  for send_time, seq, kind, note, message in events]
+    heapq.heapify(events)
+    return events
+
+
+def key_order_errors(events):
+    """Notes of an event heap whose note_on/note_off would go out of order (a key re-struck before release)."""
+    sounding = set()
+    errors = set()
+    for _, _, kind, note, message in sorted(events):
+        key = (message[0] & 0x0F, note)
+        if kind == 'on':
+            if key in sounding:
+                errors.add(note)
+            sounding.add(key)
+        elif kind == 'off':
+            sounding.discard(key)
+    return sorted(errors)
+
+
+class PlaybackEngine(threading.Thread):
+    """Stream a prepared event heap to an output port on its own thread.
+
+    Like SweepEngine it waits on absolute perf_counter deadlines; messages
+    are encoded up front in build_events so the send loop only pops and
+    writes bytes.
+    on_event(kind, note) is called from this thread for visual updates.
+    """
+
+    def __init__(self, output, midi_file, table=None, on_event=None):
+        super().__init__(daemon=True)
+        self.output = output
+        self.table = table if table is not None else load_latency_table()
+        self.events = build_events(midi_file, self.table)
+        self.event_count = len(self.events)
+        self.channels = {event[4][0] & 0x0F for event in self.events if event[4][0] < 0xF0}
+        self.on_event = on_event
+        self.stop_event = threading.Event()
+        self.max_lateness_us = 0.0
+        self.events_sent = 0
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        events = self.events
+        send = raw_sender(self.output)
+        on_event = self.on_event
+        pop = heapq.heappop
+        start = time.perf_counter() + SPIN_S
+        try:
+            while events:
+                send_time, _, kind, note, message = events[0]
+                deadline = start + send_time
+                if not wait_until(deadline, self.stop_event):
+                    break
+                pop(events)
+                send(message)
+                lateness_us = (time.perf_counter() - deadline) * 1_000_000
+                if lateness_us > self.max_lateness_us:
+                    self.max_lateness_us = lateness_us
+                self.events_sent += 1
+                if on_event is not None and kind != 'other':
+                    on_event(kind, note)
+        finally:
+            if self.stop_event.is_set():
+                send_all_notes_off(self.output, sorted(self.channels))
+            if on_event is not None:
+                on_event('done', None)
+
+
+def main(argv=None):
+    _, saved_output = load_port_settings()
+    parser = argparse.ArgumentParser(description="Play a MIDI file with per-key latency compensation")
+    parser.add_argument("file", help="MIDI file to play")
+    parser.add_argument("--output", default=saved_output,
+                        help=f"MIDI output port, or '{loopback.SIMULATED_PORT}' (default: from midi_ports.json)")
+    parser.add_argument("--table", default=TABLE_FILE, help=f"Response table (default: {TABLE_FILE})")
+    args = parser.parse_args(argv)
+
+    midi_file = mido.MidiFile(args.file)
+    table = load_latency_table(args.table)
+    with loopback.open_output(args.output) as output:
+        engine = PlaybackEngine(output, midi_file, table)
+        print(f"{engine.event_count} events")
+        errors = key_order_errors(engine.events)
+        if errors:
+            print(f"Warning: overlapping notes on keys {errors}; they will be re-struck before release")
+        engine.start()
+        try:
+            while engine.is_alive():
+                engine.join(0.2)
+        except KeyboardInterrupt:
+            engine.stop()
+            engine.join()
+    print(f"Sent {engine.events_sent} events, max scheduling error {engine.max_lateness_us:.0f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
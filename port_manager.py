@@ -0,0 +1,96 @@
+import threading
+
+import mido
+
+MIN_POLL_S = 0.5  # Check this often right after a change
+MAX_POLL_S = 8.0  # Back off to this while nothing changes
+
+
+class PortWatcher(threading.Thread):
+    """Enumerate MIDI ports on a background thread and report changes.
+
+    The last enumeration is kept in inputs/outputs so the GUI never has to
+    call into the backend itself. The interval doubles each time the lists
+    come back unchanged (or enumeration fails) up to MAX_POLL_S, and drops
+    back to MIN_POLL_S after a change or a refresh(). on_change(inputs,
+    outputs) runs on this thread and must not touch Tk directly.
+    """
+
+    def __init__(self, on_change=None, min_poll_s=MIN_POLL_S, max_poll_s=MAX_POLL_S):
+        super().__init__(daemon=True)
+        self.on_change = on_change
+        self.min_poll_s = min_poll_s
+        self.max_poll_s = max_poll_s
+        self.inputs = None  # None until the first enumeration finishes
+        self.outputs = None
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+
+    def refresh(self):
+        """Enumerate again now and go back to the short interval."""
+        self.wake_event.set()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+
+    def run(self):
+        interval = self.min_poll_s
+        while not self.stop_event.is_set():
+            try:
+                inputs = mido.get_input_names()
+                outputs = mido.get_output_names()
+            except Exception as e:
+                print(f"Error listing MIDI ports: {e}")
+                inputs, outputs = self.inputs or [], self.outputs or []  # No backend still counts as a (empty) list
+            if (inputs, outputs) != (self.inputs, self.outputs):
+                self.inputs, self.outputs = inputs, outputs
+                if self.on_change:
+                    self.on_change(inputs, outputs)
+                interval = self.min_poll_s
+            else:
+                interval = min(interval * 2, self.max_poll_s)
+            if self.wake_event.wait(interval):
+                self.wake_event.clear()
+                interval = self.min_poll_s
+
+
+class PortSlot:
+    """One wanted MIDI port that is opened whenever it is present.
+
+    wanted is the name chosen by the user (or loaded from midi_ports.json)
+    and survives the device being unplugged, so the port is reopened as soon
+    as it shows up again. sync() only closes or opens the port when the
+    wanted name or its availability actually changed.
+    """
+
+    def __init__(self, opener):
+        self.opener = opener  # name -> open port
+        self.wanted = "None"
+        self.name = None  # Name of the open port
+        self.port = None
+
+    def sync(self, available):
+        """Bring the open port in line with wanted and the available names. Returns True if it changed."""
+        wanted = self.wanted if self.wanted in available else None
+        if self.name == wanted:
+            return False
+        self.close()
+        if wanted is not None:
+            try:
+                self.port = self.opener(wanted)
+                self.name = wanted
+                print(f"Connected to {wanted}")
+            except Exception as e:
+                print(f"Error opening MIDI port {wanted}: {e}")
+        return True
+
+    def close(self):
+        if self.port is not None:
+            print(f"Closing {self.name}")
+            try:
+                self.port.close()
+            except Exception as e:
+                print(f"Error closing MIDI port {self.name}: {e}")
+        self.port = None
+        self.name = None
@@ -0,0 +1,149 @@
+import argparse
+import os
+import struct
+import sys
+from array import array
+from statistics import median
+
+from calibration_store import CALIBRATION_FILE, read_csv_rows
+
+FIRST_NOTE = 21  # A0
+NUM_KEYS = 88
+NUM_VELOCITIES = 128
+TABLE_FILE = "response_table.bin"
+TABLE_MAGIC = b"PPRESP\x00\x01"
+TABLE_HEADER = struct.Struct("<8sII")  # magic, keys, velocities
+
+
+def velocity_grid(steps=8):
+    """Evenly spaced velocities from 127/steps up to 127."""
+    return sorted({max(1, round(127 * (i + 1) / steps)) for i in range(steps)})
+
+
+def _interpolate(points, velocity):
+    """Piecewise-linear value at velocity from sorted (velocity, value) points, flat beyond the ends."""
+    if velocity <= points[0][0]:
+        return points[0][1]
+    if velocity >= points[-1][0]:
+        return points[-1][1]
+    for (v0, y0), (v1, y1) in zip(points, points[1:]):
+        if v0 <= velocity <= v1:
+            return y0 + (y1 - y0) * (velocity - v0) / (v1 - v0)
+    return points[-1][1]
+
+
+def _curve_points(samples):
+    """{velocity: [values]} -> sorted [(velocity, median value)]"""
+    return sorted((velocity, median(values)) for velocity, values in samples.items() if values)
+
+
+class ResponseTable:
+    """Precomputed velocity -> latency / received velocity for every key.
+
+    Both tables are flat 88 x 128 arrays indexed by (note - 21) * 128 + velocity,
+    so lookups at send time are a single index with no arithmetic on curves.
+    """
+
+    def __init__(self, latency_ms=None, received_velocity=None):
+        size = NUM_KEYS * NUM_VELOCITIES
+        self.latency_ms = latency_ms if latency_ms is not None else array("f", [0.0] * size)
+        self.received_velocity = (received_velocity if received_velocity is not None
+                                  else array("B", list(range(NUM_VELOCITIES)) * NUM_KEYS))
+
+    def latency(self, note, velocity):
+        """Expected actuation latency in ms, 0.0 for notes outside the keyboard."""
+        index = note - FIRST_NOTE
+        if 0 <= index < NUM_KEYS:
+            return self.latency_ms[index * NUM_VELOCITIES + velocity]
+        return 0.0
+
+    def received(self, note, velocity):
+        """Velocity the piano is expected to report back for a sent velocity."""
+        index = note - FIRST_NOTE
+        if 0 <= index < NUM_KEYS:
+            return self.received_velocity[index * NUM_VELOCITIES + velocity]
+        return velocity
+
+    @classmethod
+    def fit(cls, rows):
+        """Fit per-key curves from calibration rows and fill the lookup tables.
+
+        rows are (note, sent_velocity, received_velocity, rt_ms, ...) as
+        produced by calibration_store.read_csv_rows. Each key's curve is the
+        piecewise-linear interpolation of the per-velocity medians; keys with
+        no measurements use the curve of all keys combined.
+        """
+        per_key_rt = {}
+        per_key_received = {}
+        all_rt = {}
+        all_received = {}
+        for note, sent_velocity, received_velocity, rt_ms, *_ in rows:
+            if rt_ms != rt_ms or not 0 <= note - FIRST_NOTE < NUM_KEYS or sent_velocity <= 0:
+                continue  # Legacy rows without RT, or notes the piano doesn't have
+            per_key_rt.setdefault(note, {}).setdefault(sent_velocity, []).append(rt_ms)
+            per_key_received.setdefault(note, {}).setdefault(sent_velocity, []).append(received_velocity)
+            all_rt.setdefault(sent_velocity, []).append(rt_ms)
+            all_received.setdefault(sent_velocity, []).append(received_velocity)
+
+        table = cls()
+        if not all_rt:
+            return table
+        fallback_rt = _curve_points(all_rt)
+        fallback_received = _curve_points(all_received)
+        for index in range(NUM_KEYS):
+            note = index + FIRST_NOTE
+            rt_points = _curve_points(per_key_rt[note]) if note in per_key_rt else fallback_rt
+            received_points = _curve_points(per_key_received[note]) if note in per_key_received else fallback_received
+            base = index * NUM_VELOCITIES
+            for velocity in range(1, NUM_VELOCITIES):
+                table.latency_ms[base + velocity] = _interpolate(rt_points, velocity)
+                table.received_velocity[base + velocity] = min(127, max(0, round(_interpolate(received_points, velocity))))
+        return table
+
+    def save(self, path=TABLE_FILE):
+        if sys.byteorder != "little":
+            raise ValueError("Response table files are little-endian")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(TABLE_HEADER.pack(TABLE_MAGIC, NUM_KEYS, NUM_VELOCITIES))
+            self.latency_ms.tofile(f)
+            self.received_velocity.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=TABLE_FILE):
+        if sys.byteorder != "little":
+            raise ValueError("Response table files are little-endian")
+        size = NUM_KEYS * NUM_VELOCITIES
+        with open(path, "rb") as f:
+            magic, keys, velocities = TABLE_HEADER.unpack(f.read(TABLE_HEADER.size))
+            if magic != TABLE_MAGIC or (keys, velocities) != (NUM_KEYS, NUM_VELOCITIES):
+                raise ValueError(f"{path} is not a response table file")
+            latency_ms = array("f")
+            latency_ms.fromfile(f, size)
+            received_velocity = array("B")
+            received_velocity.fromfile(f, size)
+        return cls(latency_ms, received_velocity)
+
+
+def load_latency_table(table_path=TABLE_FILE, csv_path=CALIBRATION_FILE):
+    """Response table from disk, else fitted from the calibration log, else all zeros."""
+    if os.path.exists(table_path):
+        return ResponseTable.load(table_path)
+    if os.path.exists(csv_path):
+        return ResponseTable.fit(read_csv_rows(csv_path))
+    return ResponseTable()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit a velocity response table from logged calibration data")
+    parser.add_argument("csv", nargs="?", default=CALIBRATION_FILE, help=f"Calibration log (default: {CALIBRATION_FILE})")
+    parser.add_argument("--table", default=TABLE_FILE, help=f"Output file (default: {TABLE_FILE})")
+    args = parser.parse_args(argv)
+    ResponseTable.fit(read_csv_rows(args.csv)).save(args.table)
+    print(f"Response table saved to {args.table}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
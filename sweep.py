@@ -0,0 +1,115 @@
+import threading
+import time
+
+from midi_bytes import note_off_bytes, note_on_bytes, raw_sender
+
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+PIANO_NOTES = range(21, 109)  # A0 (21) to C8 (108)
+SPIN_S = 0.002  # Busy-wait the last 2 ms before a deadline instead of sleeping
+
+
+def note_name(note):
+    """MIDI note number to name with octave, e.g. 21 -> A0"""
+    return f"{NOTE_NAMES[note % 12]}{(note // 12) - 1}"
+
+
+def wait_until(deadline, stop_event=None):
+    """Sleep until shortly before an absolute perf_counter deadline, then spin.
+
+    Returns False if stop_event was set while waiting.
+    """
+    while True:
+        if stop_event is not None and stop_event.is_set():
+            return False
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return True
+        if remaining > SPIN_S:
+            time.sleep(remaining - SPIN_S)
+
+
+class SweepEngine(threading.Thread):
+    """Play a note_on/note_off sequence on its own thread with a deadline clock.
+
+    Every event has an absolute target time computed from the sweep start, so
+    a late event never pushes back the ones after it. Messages go straight to
+    the output port; on_event(kind, note) is called for visual updates and
+    must not touch Tk directly (it runs on this thread).
+
+    If velocities is given, each key is struck once per velocity in the grid
+    (in order) instead of once at velocity. If stages (an
+    instrumentation.StageTimer) is given along with tracker, each note_on's
+    send is stamped for the per-stage latency breakdown.
+    """
+
+    def __init__(self, output, notes=PIANO_NOTES, velocity=127, delay_ms=50,
+                 tracker=None, on_event=None, repeats=1, channel=0, velocities=None, stages=None):
+        super().__init__(daemon=True)
+        self.output = output
+        self.notes = list(notes)
+        self.velocity = velocity
+        self.velocities = list(velocities) if velocities else [velocity]
+        self.delay_s = delay_ms / 1000
+        self.tracker = tracker
+        self.stages = stages
+        self.on_event = on_event
+        self.repeats = repeats
+        self.channel = channel
+        self.stop_event = threading.Event()
+        self.max_lateness_us = 0.0  # Worst observed scheduling error
+        self.total_lateness_us = 0.0
+        self.events_sent = 0
+        self.elapsed_s = 0.0
+
+    def stop(self):
+        self.stop_event.set()
+
+    def build_schedule(self):
+        """Pre-build (offset_s, kind, note, velocity, encoded message) for the whole sweep."""
+        schedule = []
+        step = 0
+        for _ in range(self.repeats):
+            for note in self.notes:
+                note_off = note_off_bytes(note, 0, self.channel)
+                for velocity in self.velocities:
+                    note_on = note_on_bytes(note, velocity, self.channel)
+                    # Key is held for one delay, then released for one delay before the next strike
+                    schedule.append((step * self.delay_s, 'on', note, velocity, note_on))
+                    schedule.append(((step + 1) * self.delay_s, 'off', note, 0, note_off))
+                    step += 2
+        return schedule
+
+    def run(self):
+        schedule = self.build_schedule()
+        send = raw_sender(self.output)
+        tracker = self.tracker
+        stages = self.stages
+        on_event = self.on_event
+        start = time.perf_counter() + SPIN_S  # Small lead-in so the first event is on time too
+        try:
+            for offset, kind, note, velocity, message in schedule:
+                deadline = start + offset
+                if not wait_until(deadline, self.stop_event):
+                    break
+                if kind == 'on' and tracker is not None:
+                    event_ns = time.perf_counter_ns()
+                    seq = tracker.sent(note, velocity, event_ns)
+                    send(message)
+                    if stages is not None:
+                        stages.sent(seq, event_ns, event_ns, time.perf_counter_ns())  # Encoded up front
+                else:
+                    send(message)
+                lateness_us = (time.perf_counter() - deadline) * 1_000_000
+                self.total_lateness_us += lateness_us
+                if lateness_us > self.max_lateness_us:
+                    self.max_lateness_us = lateness_us
+                self.events_sent += 1
+                if on_event is not None:
+                    on_event(kind, note)
+        finally:
+            self.elapsed_s = time.perf_counter() - start
+            if on_event is not None:
+                on_event('done', None)
+
+    def mean_lateness_us(self):
+        return self.total_lateness_us / self.events_sent if self.events_sent else 0.0